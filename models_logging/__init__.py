@@ -1,4 +1,4 @@
-from threading import local
+from contextvars import ContextVar
 from typing import Union, Dict, TYPE_CHECKING
 
 from django.core.handlers.wsgi import WSGIRequest
@@ -9,17 +9,48 @@ if TYPE_CHECKING:
 default_app_config = "models_logging.apps.LoggingConfig"
 
 
-class _Local(local):
+class _ContextAttribute:
+    """
+    Attribute of `_Local` stored in a context variable, so it's isolated
+    between threads, asyncio tasks and propagated through `sync_to_async`
+    :param factory: creates a default value on first access in a context (for mutable values)
+    """
+
+    def __init__(self, default=None, factory=None):
+        self.default = default
+        self.factory = factory
+
+    def __set_name__(self, owner, name):
+        self.var = ContextVar("models_logging.%s" % name)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return self.var.get()
+        except LookupError:
+            if self.factory is None:
+                return self.default
+            value = self.factory()
+            self.var.set(value)
+            return value
+
+    def __set__(self, instance, value):
+        self.var.set(value)
+
+
+class _Local:
     """
     :param stack_changes: all changes grouped by (object_id, content_type_id)
     it's created for grouping changes that called by multiple using of obj.save() per 1 request|operation
     """
 
-    def __init__(self):
-        self.request: "WSGIRequest" = None
-        self.ignore_changes = False
-        self.stack_changes: Dict[(Union[str, int], int), "Change"] = {}
-        self.merge_changes_allowed = False
+    request: "WSGIRequest" = _ContextAttribute()
+    ignore_changes = _ContextAttribute(default=False)
+    stack_changes: 'Dict[(Union[str, int], int), "Change"]' = _ContextAttribute(
+        factory=dict
+    )
+    merge_changes_allowed = _ContextAttribute(default=False)
 
     def ignore(self, sender, instance) -> bool:
         if (
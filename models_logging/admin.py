@@ -1,24 +1,33 @@
+from datetime import datetime, time, timedelta
 from functools import update_wrapper
 
+from django import forms
 from django.apps import apps
+from django.conf import settings
 from django.contrib import admin
 from django.contrib import messages
 from django.contrib.admin.filters import RelatedFieldListFilter
-from django.contrib.admin.utils import unquote
+from django.contrib.admin.utils import quote, unquote
 from django.contrib.admin.views.main import ChangeList
 from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import PermissionDenied
-from django.db import connection
+from django.core.exceptions import BadRequest, PermissionDenied
 from django.db import transaction
-from django.db.models.sql import Query
+from django.db.models import BLANK_CHOICE_DASH, Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
+from django.template.loader import render_to_string
 from django.template.response import TemplateResponse
 from django.urls import re_path
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.encoding import force_str
+from django.utils.formats import date_format
 from django.utils.html import format_html, format_html_join
+from django.utils.http import urlencode
 from django.utils.translation import gettext as _
 
+from .counts import estimate_count
 from .models import Change, Revision
 from .settings import (
     CAN_DELETE_CHANGES,
@@ -33,22 +42,13 @@ from .settings import (
 class ChangeListWithFastCount(ChangeList):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        self.query: Query = qs.query
+        # `self.query` is the search string of the changelist
+        self.count_queryset = qs.all()
         qs.count = self.fast_count
         return qs
 
     def fast_count(self):
-        if not (self.query.group_by or self.query.where or self.query.distinct):
-            if connection.vendor == "postgresql":
-                cursor = connection.cursor()
-                cursor.execute(
-                    "SELECT reltuples FROM pg_class WHERE relname = %s",
-                    [self.query.model._meta.db_table],
-                )
-                row = cursor.fetchone()
-                if row and row[0] >= 0:
-                    return int(row[0])
-        return self.query.get_count(using=self.queryset.db)
+        return estimate_count(self.count_queryset)
 
 
 class FastObjectsCountAdminModel(admin.ModelAdmin):
@@ -58,51 +58,65 @@ class FastObjectsCountAdminModel(admin.ModelAdmin):
         return ChangeListWithFastCount
 
 
+class HistoryFilterForm(forms.Form):
+    action = forms.ChoiceField(
+        label=_("Action"),
+        choices=BLANK_CHOICE_DASH + list(Change.ACTIONS),
+        required=False,
+    )
+    user = forms.ModelChoiceField(
+        label=_("User id"),
+        queryset=Change._meta.get_field("user").related_model._default_manager.all(),
+        required=False,
+        widget=forms.TextInput,
+    )
+    field = forms.CharField(label=_("Field"), required=False)
+    date_from = forms.DateField(
+        label=_("From"), required=False, widget=forms.DateInput(attrs={"type": "date"})
+    )
+    date_to = forms.DateField(
+        label=_("To"), required=False, widget=forms.DateInput(attrs={"type": "date"})
+    )
+
+
+class AsOfForm(forms.Form):
+    when = forms.DateTimeField(
+        label=_("As of"), widget=forms.DateTimeInput(attrs={"type": "datetime-local"})
+    )
+
+
+def day_start(day):
+    value = datetime.combine(day, time.min)
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+
 class HistoryAdmin(admin.ModelAdmin):
     object_history_template = "models_logging/object_history.html"
+    object_history_rows_template = "models_logging/object_history_rows.html"
+    object_history_change_template = "models_logging/object_history_change.html"
+    object_state_template = "models_logging/object_state.html"
     history_latest_first = False
+    # number of changes per page of the history, pages are linked by cursors
+    history_page_size = 100
     # If inline_models_history is '__all__' it will display changes for all models listed in `inlines`
     inline_models_history = "__all__"
 
     def history_view(self, request, object_id, extra_context=None):
         """Renders the history view."""
-        # Check if user has change permissions for model
-        if not self.has_change_permission(request):
-            raise PermissionDenied
-        object_id = unquote(object_id)  # Underscores in primary key get quoted to "_5F"
-
-        assert (
-            isinstance(self.inline_models_history, (tuple, list))
-            or self.inline_models_history == "__all__"
-        )
-
         # First check if the user can see this history.
         model = self.model
-        obj = self.get_object(request, object_id)
+        obj = self.get_history_object(request, object_id)
         if obj is None:
             return self._get_obj_does_not_exist_redirect(
-                request, model._meta, object_id
+                request, model._meta, unquote(object_id)
             )
 
-        if not self.has_view_or_change_permission(request, obj):
-            raise PermissionDenied
-
         # Compile the context.
-        changes_admin = False
-        if Change in admin.site._registry:
-            changes_admin = True
-
-        if self.inline_models_history == "__all__":
-            self.inline_models_history = self.inlines
-
         context = {
             **self.admin_site.each_context(request),
-            "changes": self.get_changes_queryset(obj),
-            "changes_admin": changes_admin,
+            **self.get_history_page(request, obj),
             "title": _("Change history: %s") % obj,
             "subtitle": None,
-            "opts": model._meta,
-            "object": obj,
         }
         context.update(extra_context or {})
         return TemplateResponse(
@@ -111,6 +125,142 @@ class HistoryAdmin(admin.ModelAdmin):
             context,
         )
 
+    def history_changes_view(self, request, object_id):
+        """Next page of the history for "load more" of the history view."""
+        obj = self.get_history_object(request, object_id)
+        if obj is None:
+            raise Http404
+        context = self.get_history_page(request, obj)
+        return JsonResponse(
+            {
+                "rows": render_to_string(
+                    self.object_history_rows_template, context, request
+                ),
+                "next_page_url": context["next_page_url"],
+                "more_url": context["more_url"],
+            }
+        )
+
+    def history_change_view(self, request, object_id, change_id):
+        """Data of a change, it's loaded when a row of the history is expanded."""
+        obj = self.get_history_object(request, object_id)
+        if obj is None:
+            raise Http404
+        change = get_object_or_404(
+            self.get_changes_queryset(obj)
+            .select_related(None)
+            .prefetch_related(None)
+            .only("changed_data", "extras"),
+            pk=change_id,
+        )
+        return JsonResponse(
+            {
+                "html": render_to_string(
+                    self.object_history_change_template, {"change": change}, request
+                )
+            }
+        )
+
+    def history_as_of_view(self, request, object_id):
+        """Renders the state of the object at a date."""
+        obj = self.get_history_object(request, object_id)
+        if obj is None:
+            return self._get_obj_does_not_exist_redirect(
+                request, self.opts, unquote(object_id)
+            )
+        form = AsOfForm(request.GET)
+        if not form.is_valid():
+            raise BadRequest("Invalid date")
+        when = form.cleaned_data["when"]
+        context = {
+            **self.admin_site.each_context(request),
+            "title": _("%(object)s as of %(date)s")
+            % {"object": obj, "date": date_format(when, "DATETIME_FORMAT")},
+            "subtitle": None,
+            "state": Change.objects.state_at(obj, when),
+            "opts": self.opts,
+            "object": obj,
+        }
+        return TemplateResponse(request, self.object_state_template, context)
+
+    def get_history_object(self, request, object_id):
+        """:return: object which history the user can see, None if it doesn't exist"""
+        # Check if user has change permissions for model
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        # Underscores in primary key get quoted to "_5F"
+        obj = self.get_object(request, unquote(object_id))
+        if obj is not None and not self.has_view_or_change_permission(request, obj):
+            raise PermissionDenied
+        return obj
+
+    def get_history_page(self, request, obj):
+        """
+        :return: context with a page of the history filtered by query parameters,
+        data of changes is loaded when their rows are expanded
+        """
+        form = HistoryFilterForm(request.GET)
+        if not form.is_valid():
+            raise BadRequest("Invalid history filters")
+        changes = self.filter_history(self.get_changes_queryset(obj), form.cleaned_data)
+        try:
+            changes, next_cursor = changes.defer("changed_data", "extras").keyset_page(
+                self.history_page_size,
+                after=request.GET.get("after"),
+                latest_first=self.history_latest_first,
+            )
+        except ValueError:
+            raise BadRequest("Invalid page cursor")
+
+        filters = {
+            name: value
+            for name, value in request.GET.items()
+            if name in form.fields and value
+        }
+        next_page_url = more_url = None
+        if next_cursor:
+            query = urlencode({**filters, "after": next_cursor})
+            info = self.opts.app_label, self.opts.model_name
+            next_page_url, more_url = (
+                "%s?%s"
+                % (
+                    reverse("admin:%s_%s_%s" % (*info, name), args=[quote(obj.pk)]),
+                    query,
+                )
+                for name in ("history", "history_changes")
+            )
+        return {
+            "changes": changes,
+            "filter_form": form,
+            "as_of_form": AsOfForm(),
+            "first_page_url": "?%s" % urlencode(filters)
+            if request.GET.get("after")
+            else None,
+            "next_page_url": next_page_url,
+            "more_url": more_url,
+            "changes_admin": Change in admin.site._registry,
+            "opts": self.opts,
+            "object": obj,
+        }
+
+    def filter_history(self, changes, filters):
+        """
+        :param filters: cleaned data of HistoryFilterForm
+        """
+        if filters["action"]:
+            changes = changes.filter(action=filters["action"])
+        if filters["user"]:
+            changes = changes.filter(user=filters["user"])
+        if filters["field"]:
+            changes = changes.touching(filters["field"])
+        if filters["date_from"]:
+            changes = changes.filter(date_created__gte=day_start(filters["date_from"]))
+        if filters["date_to"]:
+            changes = changes.filter(
+                date_created__lt=day_start(filters["date_to"] + timedelta(days=1))
+            )
+        return changes
+
     def get_changes_queryset(self, obj):
         qs = Change.get_changes_by_obj(
             obj, related_models=self.get_related_objects_for_changes()
@@ -120,12 +270,48 @@ class HistoryAdmin(admin.ModelAdmin):
         return qs
 
     def get_related_objects_for_changes(self):
+        assert (
+            isinstance(self.inline_models_history, (tuple, list))
+            or self.inline_models_history == "__all__"
+        )
+        inlines = (
+            self.inlines
+            if self.inline_models_history == "__all__"
+            else self.inline_models_history
+        )
         return [
             m
             for m in self.model._meta.related_objects
-            if m.related_model in [i.model for i in self.inline_models_history]
+            if m.related_model in [i.model for i in inlines]
         ]
 
+    def get_urls(self):
+        def wrap(view):
+            def wrapper(*args, **kwargs):
+                return self.admin_site.admin_view(view)(*args, **kwargs)
+
+            wrapper.model_admin = self
+            return update_wrapper(wrapper, view)
+
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            re_path(
+                r"^(.+)/history/as-of/$",
+                wrap(self.history_as_of_view),
+                name="%s_%s_history_as_of" % info,
+            ),
+            re_path(
+                r"^(.+)/history/changes/$",
+                wrap(self.history_changes_view),
+                name="%s_%s_history_changes" % info,
+            ),
+            re_path(
+                r"^(.+)/history/changes/(\d+)/$",
+                wrap(self.history_change_view),
+                name="%s_%s_history_change" % info,
+            ),
+        ] + super().get_urls()
+
 
 class ContentTypeFilterForChange(RelatedFieldListFilter):
     def field_choices(self, field, request, model_admin):
@@ -155,6 +341,13 @@ class ChangeAdmin(FastObjectsCountAdminModel):
     raw_id_fields = ["revision"]
     list_select_related = ("user", "content_type")
 
+    def get_list_select_related(self, request):
+        # relations stored in another database are prefetched in get_queryset
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_related(*self.list_select_related)
+
     def get_comment(self, obj):
         return "%s: %s" % (obj.action, obj.object_repr)
 
@@ -166,7 +359,7 @@ class ChangeAdmin(FastObjectsCountAdminModel):
                     reverse(
                         "admin:%s_%s_change"
                         % (obj.content_type.app_label, obj.content_type.model),
-                        args=[obj.object_id],
+                        args=[quote(obj.object_id)],
                     ),
                     obj.object_repr,
                 )
@@ -213,7 +406,7 @@ class ChangeAdmin(FastObjectsCountAdminModel):
                         reverse(
                             "admin:%s_%s_delete"
                             % (obj.content_type.app_label, obj.content_type.model),
-                            args=[obj.object_id],
+                            args=[quote(obj.object_id)],
                         )
                     )
             try:
@@ -258,9 +451,7 @@ class ChangeInline(admin.TabularInline):
 
     def get_queryset(self, request):
         return (
-            super(ChangeInline, self)
-            .get_queryset(request)
-            .select_related("content_type")
+            super(ChangeInline, self).get_queryset(request).with_related("content_type")
         )
 
     def has_add_permission(self, request, *args, **kwargs):
@@ -275,19 +466,35 @@ class ChangeInline(admin.TabularInline):
 
 
 class RevisionAdmin(FastObjectsCountAdminModel):
-    inlines = [ChangeInline]
     list_display = ["__str__", "comment", "changes"]
     list_filter = ["date_created"]
-    change_form_template = "models_logging/change_form.html"
+    change_form_template = "models_logging/revision_change_form.html"
     revert_form_template = "models_logging/revert_revision_confirmation.html"
     readonly_fields = ["comment"]
     search_fields = ["=id", "=change__id"]
 
     def get_queryset(self, request):
+        # the count is a correlated subquery, only ids of the first changes are loaded
+        changes_count = (
+            Change.objects.filter(revision=OuterRef("pk"))
+            .order_by()
+            .values("revision")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
         return (
             super(RevisionAdmin, self)
             .get_queryset(request)
-            .prefetch_related("change_set")
+            .annotate(changes_count=Coalesce(Subquery(changes_count), 0))
+            .prefetch_related(
+                Prefetch(
+                    "change_set",
+                    queryset=Change.objects.only("id", "revision_id")[
+                        :CHANGES_REVISION_LIMIT
+                    ],
+                    to_attr="first_changes",
+                )
+            )
         )
 
     def has_delete_permission(self, request, obj=None):
@@ -308,22 +515,37 @@ class RevisionAdmin(FastObjectsCountAdminModel):
         )
 
     def changes(self, obj):
-        count = obj.change_set.count()
+        count = obj.changes_count
         if count > CHANGES_REVISION_LIMIT:
             return "Changes count - %s" % count
         return format_html_join(
             ", ",
             '<a href="{}">{}</a>',
-            ((i.get_admin_url(), i.id) for i in obj.change_set.all()),
+            ((i.get_admin_url(), i.id) for i in obj.first_changes),
         )
 
-    def get_inline_formsets(self, request, formsets, inline_instances, obj=None):
-        for formset in formsets:
-            if formset.queryset.count() > CHANGES_REVISION_LIMIT:
-                formset.queryset = formset.queryset[:CHANGES_REVISION_LIMIT]
-        return super(RevisionAdmin, self).get_inline_formsets(
-            request, formsets, inline_instances, obj
-        )
+    def render_change_form(self, request, context, obj=None, **kwargs):
+        # changes are a read-only paginated table instead of an inline formset
+        if obj is not None:
+            after = request.GET.get("changes_after")
+            try:
+                changes, next_cursor = (
+                    Change.objects.filter(revision=obj)
+                    .only(*ChangeInline.fields[1:], "date_created")
+                    .with_related("content_type")
+                    .keyset_page(CHANGES_REVISION_LIMIT, after=after)
+                )
+            except ValueError:
+                raise BadRequest("Invalid page cursor")
+            context.update(
+                {
+                    "revision_changes": changes,
+                    "revision_changes_first_url": "?" if after else None,
+                    "revision_changes_next_url": next_cursor
+                    and "?%s" % urlencode({"changes_after": next_cursor}),
+                }
+            )
+        return super().render_change_form(request, context, obj=obj, **kwargs)
 
     def get_urls(self):
         def wrap(view):
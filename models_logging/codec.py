@@ -0,0 +1,200 @@
+"""
+Codecs of `Change.changed_data`, the codec is chosen by `LOGGING_CHANGED_DATA_CODEC`.
+
+A codec encodes values of every field separately, keys of `changed_data` are kept,
+so changes are still filtered by names of changed fields.
+Encoded values are decoded on read whatever codec is configured.
+"""
+
+import base64
+import difflib
+import json
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB = "zlib"
+ZSTD = "zstd"
+
+
+class CompactCodec:
+    """
+    Stores the new value of a field as a difference from the old one:
+    JSON Patch for dicts and lists, changed lines for long texts,
+    values of a field which are still large are compressed.
+    Subclass it to change the limits:
+    :param diff_min_size: min length of texts which are stored as changed lines
+    :param compress_min_size: min size of the json of a field which is compressed
+    :param compression: "zlib" or "zstd" (requires `zstandard`)
+    """
+
+    diff_min_size = 1024
+    compress_min_size = 4096
+    compression = ZLIB
+
+    def __init__(self, encoder):
+        if self.compression not in (ZLIB, ZSTD):
+            raise ImproperlyConfigured("Compression must be %s or %s" % (ZLIB, ZSTD))
+        if self.compression == ZSTD and zstandard is None:
+            raise ImproperlyConfigured("zstd compression requires `zstandard` package")
+        self.encoder = encoder
+
+    def dumps(self, value):
+        return json.dumps(value, cls=self.encoder, ensure_ascii=False)
+
+    def encode(self, changed_data):
+        return {
+            field: self.encode_values(values) if isinstance(values, dict) else values
+            for field, values in changed_data.items()
+        }
+
+    def encode_values(self, values):
+        """
+        :param values: dict of "old" and "new" values of a field
+        """
+        if "new" in values:
+            old, new = values.get("old"), values["new"]
+            if isinstance(old, (dict, list)) and isinstance(new, (dict, list)):
+                old, new = json.loads(self.dumps(old)), json.loads(self.dumps(new))
+                patch = make_patch(old, new)
+                if len(self.dumps(patch)) < len(self.dumps(new)):
+                    values = {"old": old, "patch": patch}
+            elif (
+                isinstance(old, str)
+                and isinstance(new, str)
+                and min(len(old), len(new)) >= self.diff_min_size
+            ):
+                diff = make_line_diff(old, new)
+                if len(self.dumps(diff)) < len(new):
+                    values = {"old": old, "lines": diff}
+
+        dumped = self.dumps(values)
+        if len(dumped) >= self.compress_min_size:
+            if self.compression == ZSTD:
+                compressed = zstandard.ZstdCompressor().compress(dumped.encode())
+            else:
+                compressed = zlib.compress(dumped.encode())
+            encoded = base64.b64encode(compressed).decode()
+            if len(encoded) < len(dumped):
+                values = {self.compression: encoded}
+        return values
+
+
+def decode(changed_data):
+    """:return: changed_data with plain "old" and "new" values of fields"""
+    if not isinstance(changed_data, dict):
+        return changed_data
+    return {
+        field: decode_values(values) if isinstance(values, dict) else values
+        for field, values in changed_data.items()
+    }
+
+
+def decode_values(values):
+    if ZLIB in values:
+        values = json.loads(zlib.decompress(base64.b64decode(values[ZLIB])))
+    elif ZSTD in values:
+        values = json.loads(
+            zstandard.ZstdDecompressor().decompress(base64.b64decode(values[ZSTD]))
+        )
+    if "patch" in values:
+        return {
+            "old": values["old"],
+            "new": apply_patch(values["old"], values["patch"]),
+        }
+    if "lines" in values:
+        return {
+            "old": values["old"],
+            "new": apply_line_diff(values["old"], values["lines"]),
+        }
+    return values
+
+
+def make_patch(old, new, path=""):
+    """
+    :return: operations of JSON Patch (RFC 6902) turning `old` to `new`
+    """
+    if type(old) is not type(new) or not isinstance(old, (dict, list)):
+        return [] if old == new else [{"op": "replace", "path": path, "value": new}]
+
+    ops = []
+    if isinstance(old, dict):
+        for key in old:
+            key_path = "%s/%s" % (path, escape_pointer(key))
+            if key not in new:
+                ops.append({"op": "remove", "path": key_path})
+            else:
+                ops.extend(make_patch(old[key], new[key], key_path))
+        for key in new:
+            if key not in old:
+                key_path = "%s/%s" % (path, escape_pointer(key))
+                ops.append({"op": "add", "path": key_path, "value": new[key]})
+        return ops
+
+    for i in range(min(len(old), len(new))):
+        ops.extend(make_patch(old[i], new[i], "%s/%s" % (path, i)))
+    for i in range(len(old) - 1, len(new) - 1, -1):
+        ops.append({"op": "remove", "path": "%s/%s" % (path, i)})
+    for i in range(len(old), len(new)):
+        ops.append({"op": "add", "path": "%s/%s" % (path, i), "value": new[i]})
+    return ops
+
+
+def apply_patch(document, patch):
+    """Applies add, remove and replace operations of JSON Patch"""
+    document = json.loads(json.dumps(document))
+    for op in patch:
+        keys = [unescape_pointer(k) for k in op["path"].split("/")[1:]]
+        if not keys:
+            document = op["value"]
+            continue
+        target = document
+        for key in keys[:-1]:
+            target = target[int(key) if isinstance(target, list) else key]
+        key = keys[-1]
+        if isinstance(target, list):
+            key = len(target) if key == "-" else int(key)
+        if op["op"] == "remove":
+            del target[key]
+        elif op["op"] == "add" and isinstance(target, list):
+            target.insert(key, op["value"])
+        else:
+            target[key] = op["value"]
+    return document
+
+
+def escape_pointer(key):
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def unescape_pointer(key):
+    return key.replace("~1", "/").replace("~0", "~")
+
+
+def make_line_diff(old, new):
+    """
+    :return: list of [start, end, lines] replacing lines of `old` from start to end
+    """
+    old_lines, new_lines = old.splitlines(True), new.splitlines(True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        [i1, i2, new_lines[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_line_diff(old, diff):
+    old_lines = old.splitlines(True)
+    lines, position = [], 0
+    for start, end, replacement in diff:
+        lines.extend(old_lines[position:start])
+        lines.extend(replacement)
+        position = end
+    lines.extend(old_lines[position:])
+    return "".join(lines)
@@ -0,0 +1,94 @@
+"""
+Estimators of the number of rows for admin changelists.
+
+An estimator takes a queryset and returns its number of rows or None
+if it can't estimate it, then the next estimator of `LOGGING_COUNT_ESTIMATORS` is used.
+The exact count is used if no estimator returned a number.
+"""
+
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from .settings import (
+    COUNT_CACHE_TIMEOUT,
+    COUNT_ESTIMATE_THRESHOLD,
+    COUNT_ESTIMATORS,
+    COUNT_LIMIT,
+)
+
+
+def estimate_count(queryset):
+    for path in COUNT_ESTIMATORS:
+        count = import_string(path)(queryset)
+        if count is not None:
+            return count
+    return queryset.count()
+
+
+def is_filtered(queryset):
+    query = queryset.query
+    return bool(query.where or query.group_by or query.distinct or query.is_sliced)
+
+
+def trusted(estimate):
+    """Small estimates are inaccurate and the exact count of small sets is cheap"""
+    if estimate is not None and estimate >= COUNT_ESTIMATE_THRESHOLD:
+        return int(estimate)
+    return None
+
+
+def table_estimate(queryset):
+    """
+    Number of rows of the table from statistics of the database,
+    only for querysets without filters (PostgreSQL, MySQL)
+    """
+    if is_filtered(queryset):
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            # partitioned tables don't have statistics, their partitions do
+            cursor.execute(
+                "SELECT SUM(c.reltuples) FROM pg_class c WHERE c.reltuples >= 0 "
+                "AND (c.oid = %s::regclass OR c.oid IN "
+                "(SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass))",
+                [connection.ops.quote_name(table)] * 2,
+            )
+        elif connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s",
+                [table],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    return trusted(row and row[0])
+
+
+def explain_estimate(queryset):
+    """Number of rows estimated by the planner of PostgreSQL for filtered querysets"""
+    if connections[queryset.db].vendor != "postgresql" or not is_filtered(queryset):
+        return None
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return trusted(plan[0]["Plan"]["Plan Rows"])
+
+
+def cached_count(queryset):
+    """Exact count cached for `LOGGING_COUNT_CACHE_TIMEOUT` seconds"""
+    queryset = queryset.order_by()
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    key = "models_logging:count:%s" % (
+        hashlib.md5(("%s:%s:%r" % (queryset.db, sql, params)).encode()).hexdigest()
+    )
+    return cache.get_or_set(key, queryset.count, COUNT_CACHE_TIMEOUT)
+
+
+def limited_count(queryset):
+    """Counts at most `LOGGING_COUNT_LIMIT` rows, bigger sets are shown as this number"""
+    return queryset.order_by()[:COUNT_LIMIT].count()
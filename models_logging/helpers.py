@@ -1,40 +1,196 @@
 import copy
+import operator
+from functools import partial
 from typing import Union, List
 
-from django.db import transaction
+from django.db import models, router, transaction
 from django.db.models.base import ModelBase
 from django.utils.encoding import force_str
 from django.utils.module_loading import import_string
 
 from models_logging import settings, _local
-from models_logging.models import Change, Revision
+from models_logging.models import Change, Revision, get_object_pk_int
+from models_logging.writers import ainsert_change_fields, insert_change_fields
+
+_IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+# fields which values are never lists or dicts
+_SCALAR_FIELD_CLASSES = {
+    models.AutoField,
+    models.BigAutoField,
+    models.SmallAutoField,
+    models.BigIntegerField,
+    models.BinaryField,
+    models.BooleanField,
+    models.CharField,
+    models.DateField,
+    models.DateTimeField,
+    models.DecimalField,
+    models.DurationField,
+    models.EmailField,
+    models.FloatField,
+    models.ForeignKey,
+    models.GenericIPAddressField,
+    models.IntegerField,
+    models.OneToOneField,
+    models.PositiveBigIntegerField,
+    models.PositiveIntegerField,
+    models.PositiveSmallIntegerField,
+    models.SlugField,
+    models.SmallIntegerField,
+    models.TextField,
+    models.TimeField,
+    models.URLField,
+    models.UUIDField,
+}
+_logging_plans = {}
+
+
+class LoggingPlan:
+    """
+    Fields of a model tracked by the logging, built once per model
+    :param attnames: attnames of logged fields
+    with respect to LOGGING_IGNORE_FIELDS and LOGGING_ONLY_FIELDS
+    :param deferrable: attnames which could be deferred (concrete fields)
+    :param mutable: attnames which values could be lists or dicts and must be copied
+    :param mutable_positions: positions of `mutable` in `attnames`
+    :param getter: returns a tuple of `attnames` values of an instance,
+    None if there are non-concrete fields which should be read one by one
+    """
+
+    __slots__ = ("attnames", "deferrable", "mutable", "mutable_positions", "getter")
+
+    def __init__(self, model):
+        ignore_fields = set(getattr(model, "LOGGING_IGNORE_FIELDS", []))
+        only_fields = getattr(model, "LOGGING_ONLY_FIELDS", [])
+        fields = [
+            f
+            for f in model._meta.fields
+            if f.name not in ignore_fields
+            and f.attname not in ignore_fields
+            and (not only_fields or f.name in only_fields)
+        ]
+
+        self.attnames = tuple(f.attname for f in fields)
+        self.deferrable = frozenset(f.attname for f in fields if f.concrete)
+        # subclasses are not trusted, e.g. json fields based on TextField
+        self.mutable = tuple(
+            f.attname for f in fields if type(f) not in _SCALAR_FIELD_CLASSES
+        )
+        self.mutable_positions = tuple(self.attnames.index(f) for f in self.mutable)
+
+        self.getter = None
+        if len(self.deferrable) == len(self.attnames):
+            if len(self.attnames) > 1:
+                self.getter = operator.attrgetter(*self.attnames)
+            elif self.attnames:
+                getter = operator.attrgetter(*self.attnames)
+                self.getter = lambda instance: (getter(instance),)
+            else:
+                self.getter = lambda instance: ()
+
+
+def get_logging_plan(model) -> LoggingPlan:
+    try:
+        return _logging_plans[model]
+    except KeyError:
+        plan = _logging_plans[model] = LoggingPlan(model)
+        return plan
 
 
 def model_to_dict(instance, action=None):
-    opts = instance._meta
-    ignore_fields = set(getattr(instance, "LOGGING_IGNORE_FIELDS", []))
-    only_fields = getattr(instance, "LOGGING_ONLY_FIELDS", [])
-    if action != settings.DELETED:
-        ignore_fields.update(instance.get_deferred_fields())
-
-    fnames = [
-        f.attname
-        for f in opts.fields
-        if f.name not in ignore_fields
-        and f.attname not in ignore_fields
-        and (not only_fields or f.name in only_fields)
-    ]
-
-    data = {}
-    for f in fnames:
-        fvalue = getattr(instance, f, None)
-        if isinstance(fvalue, (list, dict)):
-            fvalue = copy.deepcopy(fvalue)
+    plan = get_logging_plan(instance.__class__)
+    instance_dict = instance.__dict__
 
-        data[f] = fvalue
+    if plan.getter and (
+        action == settings.DELETED or instance_dict.keys() >= plan.deferrable
+    ):
+        data = dict(zip(plan.attnames, plan.getter(instance)))
+    else:
+        # deferred fields are not logged, except for deleted objects
+        data = {
+            f: getattr(instance, f, None)
+            for f in plan.attnames
+            if action == settings.DELETED
+            or f in instance_dict
+            or f not in plan.deferrable
+        }
+
+    for f in plan.mutable:
+        fvalue = data.get(f)
+        if isinstance(fvalue, (list, dict)):
+            data[f] = copy_value(fvalue)
     return data
 
 
+def copy_value(value):
+    """
+    Faster `copy.deepcopy` for values decoded from json,
+    anything except plain dicts, lists and scalars is deep-copied.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        return {k: copy_value(v) for k, v in value.items()}
+    if value_type is list:
+        return [copy_value(v) for v in value]
+    if value_type in _IMMUTABLE_TYPES:
+        return value
+    return copy.deepcopy(value)
+
+
+def take_snapshot(instance):
+    """
+    Cheap copy of the loaded values used by `LOGGING_LAZY_SNAPSHOTS`:
+    a tuple of values of logged fields, the dict is built on the first save or delete.
+    List/dict values are still copied as in `model_to_dict`,
+    they could be changed in place before the instance is saved.
+    :return: tuple of values of `LoggingPlan.attnames`,
+    dict of loaded fields for instances with deferred fields or without pk
+    """
+    plan = get_logging_plan(instance.__class__)
+    instance_dict = instance.__dict__
+    if not instance.pk:
+        # for rest_framework
+        return dict.fromkeys(
+            f for f in plan.attnames if f in instance_dict or f not in plan.deferrable
+        )
+    if not plan.getter or not instance_dict.keys() >= plan.deferrable:
+        return model_to_dict(instance)
+
+    values = plan.getter(instance)
+    if plan.mutable_positions:
+        values = list(values)
+        for i in plan.mutable_positions:
+            if isinstance(values[i], (list, dict)):
+                values[i] = copy_value(values[i])
+        values = tuple(values)
+    return values
+
+
+class LazyLoggingAttrs:
+    """
+    Builds `instance._logging_attrs` from the snapshot taken in `post_init`
+    on first access, so instances which are never saved or deleted
+    don't pay for building the dict.
+    """
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            snapshot = instance.__dict__["_logging_snapshot"]
+        except KeyError:
+            raise AttributeError(
+                "'%s' object has no attribute '_logging_attrs'" % owner.__name__
+            )
+
+        if isinstance(snapshot, tuple):
+            snapshot = dict(
+                zip(get_logging_plan(instance.__class__).attnames, snapshot)
+            )
+        instance.__dict__["_logging_attrs"] = snapshot
+        return snapshot
+
+
 def get_changed_data(obj, action=settings.CHANGED):
     d1 = model_to_dict(obj, action)
     if action == settings.DELETED:
@@ -53,13 +209,40 @@ def create_revision_with_changes(changes: List[Change]):
     :param changes: _local.stack_changes
     :return:
     """
+    using = router.db_for_write(Revision)
+    # changes of rolled back savepoints aren't merged, see `save_changes`,
+    # the revision isn't written in a transaction of the logging database either
+    if settings.DEFER_TO_COMMIT and transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(
+            partial(create_revision_with_changes, list(changes)), using=using
+        )
+        return
+
     comment = ", ".join([c.object_repr for c in changes])
 
-    with transaction.atomic():
+    with transaction.atomic(using=using):
         rev = Revision.objects.create(comment="Changes: %s" % comment)
         for change in changes:
             change.revision = rev
         Change.objects.bulk_create(changes)
+        insert_change_fields(changes)
+
+
+async def acreate_revision_with_changes(changes: List[Change]):
+    """
+    Async version of `create_revision_with_changes`,
+    Django doesn't support transactions in async code,
+    so the revision and the changes are written without `atomic`
+    :param changes: _local.stack_changes
+    """
+    changes = list(changes)
+    comment = ", ".join([c.object_repr for c in changes])
+
+    rev = await Revision.objects.acreate(comment="Changes: %s" % comment)
+    for change in changes:
+        change.revision = rev
+    await Change.objects.abulk_create(changes)
+    await ainsert_change_fields(changes)
 
 
 def get_change_extras(object, action):
@@ -101,6 +284,7 @@ def init_change(
         user_id=_local.user_id,
         changed_data=changed_data,
         object_id=object_pk,
+        object_pk_int=get_object_pk_int(object_pk),
         content_type=content_type,
         extras=CHANGE_EXTRAS_FUNC(object, action),
     )
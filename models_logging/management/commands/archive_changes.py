@@ -0,0 +1,161 @@
+import gzip
+import io
+import json
+
+from django.conf import settings as django_settings
+from django.core.management.base import CommandError
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from models_logging import settings
+
+from .delete_changes import Command as DeleteChangesCommand
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+PARQUET = "parquet"
+
+CHANGE_FIELDS = (
+    "id",
+    "date_created",
+    "user_id",
+    "content_type_id",
+    "object_id",
+    "object_repr",
+    "action",
+    "changed_data",
+    "extras",
+    "revision_id",
+)
+# json values are stored as strings in parquet
+JSON_FIELDS = ("changed_data", "extras")
+REVISION_FIELDS = {
+    "revision_date_created": F("revision__date_created"),
+    "revision_comment": F("revision__comment"),
+}
+
+
+class Command(DeleteChangesCommand):
+    help = (
+        "Streams changes (with their revisions) to a compressed JSON Lines "
+        "or a Parquet file, optionally deletes archived changes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Path of the archive")
+        parser.add_argument(
+            "--format",
+            choices=[GZIP, ZSTD, PARQUET],
+            default=GZIP,
+            help="gzip|zstd - JSON Lines compressed by gzip|zstandard, "
+            "parquet - Parquet file (requires pyarrow)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of rows fetched from the database cursor at once",
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete archived changes",
+        )
+        self.add_filter_arguments(parser)
+        self.add_batch_arguments(parser)
+
+    def handle(self, *args, **options):
+        if options["format"] == ZSTD and zstandard is None:
+            raise CommandError("zstd format requires `zstandard` package")
+        if options["format"] == PARQUET and pyarrow is None:
+            raise CommandError("parquet format requires `pyarrow` package")
+
+        changes, _ = self.get_changes(options)
+        rows = (
+            changes.order_by("pk")
+            .values(*CHANGE_FIELDS, **REVISION_FIELDS)
+            .iterator(chunk_size=options["chunk_size"])
+        )
+
+        writer = getattr(self, "write_%s" % options["format"])
+        archived, last_pk = writer(rows, options["output"], options["chunk_size"])
+        self.stdout.write(f"{archived} Changes have been archived")
+
+        # changes created after the start are not archived, don't delete them
+        if options["delete"] and last_pk is not None:
+            self.delete_changes(changes.filter(pk__lte=last_pk), options)
+
+    @staticmethod
+    def write_jsonl(rows, file):
+        """
+        :return: number of written rows and pk of the last one
+        """
+        encoder = import_string(settings.JSON_ENCODER_PATH)
+        count, last_pk = 0, None
+        for row in rows:
+            file.write(json.dumps(row, cls=encoder, ensure_ascii=False))
+            file.write("\n")
+            count += 1
+            last_pk = row["id"]
+        return count, last_pk
+
+    def write_gzip(self, rows, output, chunk_size):
+        with gzip.open(output, "wt", encoding="utf-8") as file:
+            return self.write_jsonl(rows, file)
+
+    def write_zstd(self, rows, output, chunk_size):
+        with open(output, "wb") as raw:
+            with zstandard.ZstdCompressor().stream_writer(raw) as compressed:
+                with io.TextIOWrapper(compressed, encoding="utf-8") as file:
+                    return self.write_jsonl(rows, file)
+
+    def write_parquet(self, rows, output, chunk_size):
+        timestamp = pyarrow.timestamp(
+            "us", tz="UTC" if django_settings.USE_TZ else None
+        )
+        schema = pyarrow.schema(
+            [
+                ("id", pyarrow.int64()),
+                ("date_created", timestamp),
+                ("user_id", pyarrow.int64()),
+                ("content_type_id", pyarrow.int64()),
+                ("object_id", pyarrow.string()),
+                ("object_repr", pyarrow.string()),
+                ("action", pyarrow.string()),
+                ("changed_data", pyarrow.string()),
+                ("extras", pyarrow.string()),
+                ("revision_id", pyarrow.int64()),
+                ("revision_date_created", timestamp),
+                ("revision_comment", pyarrow.string()),
+            ]
+        )
+        encoder = import_string(settings.JSON_ENCODER_PATH)
+
+        count, last_pk = 0, None
+        with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+            batch = []
+            for row in rows:
+                for field in JSON_FIELDS:
+                    row[field] = json.dumps(row[field], cls=encoder, ensure_ascii=False)
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    writer.write_batch(pyarrow.RecordBatch.from_pylist(batch, schema))
+                    count += len(batch)
+                    last_pk = batch[-1]["id"]
+                    batch = []
+            if batch:
+                writer.write_batch(pyarrow.RecordBatch.from_pylist(batch, schema))
+                count += len(batch)
+                last_pk = batch[-1]["id"]
+        return count, last_pk
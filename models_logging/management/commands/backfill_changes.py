@@ -0,0 +1,81 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, router
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Cast
+
+from models_logging.models import Change, ChangeField, has_integer_pk
+
+from .delete_changes import BatchCommandMixin
+
+
+class Command(BatchCommandMixin, BaseCommand):
+    help = "Fills columns added to changes for existing rows by batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--object-pk-int",
+            action="store_true",
+            help="Fill `object_pk_int` of changes of models with integer pks",
+        )
+        parser.add_argument(
+            "--database",
+            default=router.db_for_write(Change),
+            help="Database alias, the database of changes by default",
+        )
+        parser.add_argument(
+            "--field-index",
+            action="store_true",
+            help="Write names of changed fields of changes to `ChangeField`",
+        )
+        self.add_batch_arguments(parser)
+
+    def handle(self, *args, **options):
+        if not options["object_pk_int"] and not options["field_index"]:
+            raise CommandError(
+                "Nothing to backfill, use --object-pk-int and/or --field-index"
+            )
+        if options["object_pk_int"]:
+            self.backfill_object_pk_int(options)
+        if options["field_index"]:
+            self.backfill_field_index(options)
+
+    def backfill_object_pk_int(self, options):
+        content_types = [
+            ct.pk
+            for ct in ContentType.objects.all()
+            if ct.model_class() and has_integer_pk(ct.model_class())
+        ]
+        changes = Change.objects.using(options["database"]).filter(
+            object_pk_int__isnull=True, content_type_id__in=content_types
+        )
+
+        self.process_by_batches(
+            changes,
+            lambda batch: batch.order_by().update(
+                object_pk_int=Cast("object_id", output_field=models.BigIntegerField())
+            ),
+            "object_pk_int: %s updated",
+            options["batch_size"],
+            options["sleep"],
+        )
+
+    def backfill_field_index(self, options):
+        changes = Change.objects.using(options["database"]).filter(
+            ~Exists(ChangeField.objects.filter(change_id=OuterRef("pk")))
+        )
+
+        def create_change_fields(batch):
+            change_fields = ChangeField.for_changes(
+                batch.order_by().only("content_type", "changed_data")
+            )
+            ChangeField.objects.using(options["database"]).bulk_create(change_fields)
+            return len(change_fields)
+
+        self.process_by_batches(
+            changes,
+            create_change_fields,
+            "Changed fields: %s created",
+            options["batch_size"],
+            options["sleep"],
+        )
@@ -0,0 +1,158 @@
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import router
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from models_logging.models import Change, Checkpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates checkpoints (full states) of objects with many changes "
+        "since their last checkpoint, should be run periodically, e.g. daily by cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every",
+            type=int,
+            default=100,
+            help="Create a checkpoint of an object after N changes since the last one",
+        )
+        parser.add_argument(
+            "--hours",
+            type=int,
+            help="Also create a checkpoint of an object "
+            "if its first change after the last checkpoint is older than N hours",
+        )
+        parser.add_argument(
+            "--ctype",
+            type=str,
+            help="ids by comma of content_types to create checkpoints for",
+        )
+        parser.add_argument(
+            "--database",
+            default=router.db_for_write(Change),
+            help="Database alias, the database of changes by default",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of objects processed by one query",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Check all objects, not only objects changed "
+            "since the last checkpoint of their content type, "
+            "e.g. after lowering --every",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        database = options["database"]
+        content_types = ContentType.objects.order_by("pk")
+        if options["ctype"]:
+            content_types = content_types.filter(id__in=options["ctype"].split(","))
+
+        created = 0
+        for content_type in content_types:
+            if content_type.model_class() is None:
+                continue
+            for object_ids in self.iter_candidates(content_type, now, options):
+                object_ids = self.filter_objects(content_type, object_ids, now, options)
+                if object_ids:
+                    created += self.create_checkpoints(
+                        content_type, object_ids, now, database
+                    )
+                    self.stdout.write(f"{created} Checkpoints have been created")
+
+    @staticmethod
+    def iter_candidates(content_type, now, options):
+        """
+        Yields batches of ids of objects which changed since the last run:
+        objects without changes after the latest checkpoint of the content type
+        were checked already (minus --hours, their first changes get older),
+        ids are read by keyset pagination, not loaded all at once.
+        """
+        changes = Change.objects.using(options["database"]).filter(
+            content_type=content_type, date_created__lte=now
+        )
+        if not options["full"]:
+            since = (
+                Checkpoint.objects.using(options["database"])
+                .filter(content_type=content_type)
+                .aggregate(since=Max("date_created"))["since"]
+            )
+            if since is not None:
+                if options["hours"] is not None:
+                    since -= timedelta(hours=options["hours"])
+                changes = changes.filter(date_created__gt=since)
+
+        object_ids = (
+            changes.order_by("object_id").values_list("object_id", flat=True).distinct()
+        )
+        last = None
+        while True:
+            page = object_ids if last is None else object_ids.filter(object_id__gt=last)
+            batch = list(page[: options["batch_size"]])
+            if not batch:
+                return
+            yield batch
+            last = batch[-1]
+
+    @staticmethod
+    def filter_objects(content_type, object_ids, now, options):
+        """
+        :return: ids of objects with --every changes since their last checkpoint
+        or with the first of them older than --hours
+        """
+        checkpoint_date = (
+            Checkpoint.objects.filter(
+                content_type=OuterRef("content_type"), object_id=OuterRef("object_id")
+            )
+            .order_by("-date_created")
+            .values("date_created")[:1]
+        )
+        condition = Q(count__gte=options["every"])
+        if options["hours"] is not None:
+            condition |= Q(first__lte=now - timedelta(hours=options["hours"]))
+        return list(
+            Change.objects.using(options["database"])
+            .filter(
+                content_type=content_type,
+                object_id__in=object_ids,
+                date_created__lte=now,
+            )
+            .annotate(checkpoint_date=Subquery(checkpoint_date))
+            .filter(
+                Q(checkpoint_date__isnull=True)
+                | Q(date_created__gt=F("checkpoint_date"))
+            )
+            .values("object_id")
+            .annotate(count=Count("pk"), first=Min("date_created"))
+            .filter(condition)
+            .order_by()
+            .values_list("object_id", flat=True)
+        )
+
+    @staticmethod
+    def create_checkpoints(content_type, object_ids, when, database):
+        states = Change.objects.using(database).replay(content_type, object_ids, when)
+        checkpoints = [
+            Checkpoint(
+                date_created=change.date_created,
+                content_type=content_type,
+                object_id=object_id,
+                change=change,
+                data=state,
+            )
+            for object_id, (state, change) in states.items()
+            if isinstance(change, Change)
+        ]
+        Checkpoint.objects.using(database).bulk_create(checkpoints)
+        return len(checkpoints)
@@ -1,14 +1,75 @@
+import time
 from datetime import timedelta
 
 from django.core.management.base import BaseCommand
+from django.db import connections, router
 from django.db.models import Exists, OuterRef
 from django.utils import timezone
 
-from models_logging.models import Change, Revision
+from models_logging.models import Change, ChangeField, Revision
+from models_logging.partitions import drop_partitions
+from models_logging.utils import pk_ranges
 
 
-class Command(BaseCommand):
+class BatchCommandMixin:
+    """
+    Processes rows of a queryset by ranges of --batch-size rows ordered by pk,
+    with progress reporting and --sleep between batches
+    """
+
+    @staticmethod
+    def add_batch_arguments(parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Number of rows processed by one query",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches",
+        )
+
+    def process_by_batches(
+        self, queryset, process_batch, message, batch_size, sleep, after_pk=None
+    ):
+        """
+        :param process_batch: takes the queryset of a batch,
+        returns the number of processed rows
+        :param message: progress message with a placeholder for the number of rows
+        :param after_pk: start from rows with pk greater than it
+        :return: number of processed rows
+        """
+        processed = 0
+        start = time.monotonic()
+        for batch, last_pk in pk_ranges(queryset, batch_size, after_pk):
+            processed += process_batch(batch)
+            elapsed = time.monotonic() - start
+            self.stdout.write(
+                message % processed
+                + f", {processed / max(elapsed, 1e-6):.0f} rows/s"
+                + (f", last pk {last_pk}" if last_pk is not None else "")
+            )
+            if last_pk is not None and sleep:
+                time.sleep(sleep)
+        return processed
+
+
+class Command(BatchCommandMixin, BaseCommand):
     def add_arguments(self, parser):
+        self.add_filter_arguments(parser)
+        self.add_batch_arguments(parser)
+        parser.add_argument(
+            "--after-pk",
+            type=int,
+            help="Delete changes with pk greater than N, "
+            "to resume from the last pk printed by the interrupted run",
+        )
+
+    @staticmethod
+    def add_filter_arguments(parser):
         parser.add_argument(
             "--ctype",
             type=str,
@@ -24,26 +85,80 @@ class Command(BaseCommand):
             type=int,
             help="The changes older than N days",
         )
+        parser.add_argument(
+            "--database",
+            default=router.db_for_write(Change),
+            help="Database alias, the database of changes by default",
+        )
 
     def handle(self, *args, **options):
+        changes, date_lte = self.get_changes(options)
+        # whole partitions are dropped, the rest is deleted by rows
+        if date_lte and not options["ctype"] and not options["ctype_exclude"]:
+            for name in drop_partitions(connections[options["database"]], date_lte):
+                self.stdout.write(f"Partition {name} has been dropped")
+
+        self.delete_changes(changes, options, after_pk=options["after_pk"])
+
+    @staticmethod
+    def get_changes(options):
+        """
+        :return: queryset of changes filtered by the options
+        and the date they are older than (fixed when the command starts)
+        """
         content_type = options["ctype"]
         older_than = options["older_than"]
         ctype_exclude = options["ctype_exclude"]
 
-        changes = Change.objects.all()
+        changes = Change.objects.using(options["database"])
         if content_type:
             changes = changes.filter(content_type__id__in=content_type.split(","))
         if ctype_exclude:
             changes = changes.exclude(content_type__id__in=ctype_exclude.split(","))
+        date_lte = None
         if older_than:
-            changes = changes.filter(
-                date_created__lte=timezone.now() - timedelta(older_than)
-            )
+            date_lte = timezone.now() - timedelta(older_than)
+            changes = changes.filter(date_created__lte=date_lte)
+        return changes, date_lte
 
-        deleted = changes._raw_delete("default")
+    def delete_changes(self, changes, options, after_pk=None):
+        """
+        Deletes changes, revisions and changed fields left without changes
+        """
+        batch_options = {
+            "batch_size": options["batch_size"],
+            "sleep": options["sleep"],
+        }
+        deleted = self.delete_by_batches(
+            changes, "Changes", after_pk=after_pk, **batch_options
+        )
         self.stdout.write(f"{deleted} Changes have been deleted")
 
-        deleted = Revision.objects.filter(
+        revisions = Revision.objects.using(options["database"]).filter(
             ~Exists(Change.objects.filter(revision_id=OuterRef("pk")))
-        )._raw_delete("default")
+        )
+        deleted = self.delete_by_batches(revisions, "Revisions", **batch_options)
         self.stdout.write(f"{deleted} Revisions have been deleted")
+
+        change_fields = ChangeField.objects.using(options["database"]).filter(
+            ~Exists(Change.objects.filter(pk=OuterRef("change_id")))
+        )
+        deleted = self.delete_by_batches(
+            change_fields, "Changed fields", **batch_options
+        )
+        self.stdout.write(f"{deleted} Changed fields have been deleted")
+
+    def delete_by_batches(self, queryset, title, batch_size, sleep, after_pk=None):
+        """
+        Every batch is deleted by a separate query (and transaction),
+        so the table is not locked and the WAL is not bloated by one huge delete
+        :return: number of deleted rows
+        """
+        return self.process_by_batches(
+            queryset,
+            lambda batch: batch.order_by()._raw_delete(queryset.db),
+            f"{title}: %s deleted",
+            batch_size,
+            sleep,
+            after_pk,
+        )
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from models_logging.models import Change
+from models_logging.partitions import (
+    convert_to_partitioned,
+    create_partitions,
+    is_partitioned,
+    validate_months,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates monthly partitions of the changes table ahead of time (PostgreSQL), "
+        "should be run periodically, e.g. daily by cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=3,
+            help="Number of months to create partitions for, after the current one",
+        )
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Convert the existing table to a partitioned one, "
+            "the table is locked only to attach it as a partition",
+        )
+        parser.add_argument(
+            "--database",
+            default=router.db_for_write(Change),
+            help="Database alias, the database of changes by default",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            validate_months(options["months"])
+        except ValueError as e:
+            raise CommandError(e)
+        connection = connections[options["database"]]
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning is supported by PostgreSQL only")
+
+        if options["convert"]:
+            if is_partitioned(connection):
+                raise CommandError("The table of changes is partitioned already")
+            convert_to_partitioned(connection, options["months"])
+            self.stdout.write("The table of changes has been converted")
+        elif not is_partitioned(connection):
+            raise CommandError(
+                "The table of changes is not partitioned, use --convert first"
+            )
+        else:
+            for name in create_partitions(connection, options["months"]):
+                self.stdout.write(f"Partition {name} has been created")
@@ -0,0 +1,155 @@
+import logging
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+
+from . import _local
+from .helpers import copy_value, get_logging_plan, init_change, model_to_dict
+from .settings import ADDED, CHANGED
+from .utils import create_changes_for_update
+from .writers import save_changes
+
+logger = logging.getLogger(__name__)
+
+
+class LoggingQuerySetMixin:
+    """
+    Logs `bulk_create`, `bulk_update` and `update` which don't send model signals,
+    changes of all objects are created at once and saved as one batch
+    class MyQuerySet(LoggingQuerySetMixin, models.QuerySet):
+        ...
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if _local.ignore(self.model, None):
+            return objs
+
+        content_type = ContentType.objects.get_for_model(self.model)
+        changes = []
+        for obj in objs:
+            # pks are not returned by some backends or with ignore_conflicts
+            if obj.pk is None:
+                continue
+            data = model_to_dict(obj)
+            # the objects are in the DB now, e.g. for `bulk_update` of them
+            obj._logging_attrs = data
+            changed_data = {
+                k: {"old": None, "new": v} for k, v in data.items() if v is not None
+            }
+            changes.append(init_change(obj, changed_data, ADDED, content_type))
+        if len(changes) < len(objs):
+            logger.warning(
+                "%s objects of %s created by bulk_create are not logged, "
+                "their pks are not returned by the database",
+                len(objs) - len(changes),
+                self.model.__name__,
+            )
+        save_changes(changes, self.db)
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if _local.ignore(self.model, None):
+            return super().bulk_update(objs, fields, batch_size)
+
+        objs = list(objs)
+        plan = get_logging_plan(self.model)
+        attnames = [
+            attname
+            for attname in (self.model._meta.get_field(f).attname for f in fields)
+            if attname in plan.attnames
+        ]
+        with transaction.atomic(using=self.db, savepoint=False):
+            old_values = self._get_old_values(objs, attnames)
+            new_values = {}
+            for obj in objs:
+                values = {a: getattr(obj, a) for a in attnames}
+                if not any(hasattr(v, "resolve_expression") for v in values.values()):
+                    new_values[obj.pk] = {
+                        a: copy_value(v) if isinstance(v, (list, dict)) else v
+                        for a, v in values.items()
+                    }
+
+            # bulk_update calls `update` which must not be logged once more
+            ignore_changes = _local.ignore_changes
+            _local.ignore_changes = True
+            try:
+                rows = super().bulk_update(objs, fields, batch_size)
+            finally:
+                _local.ignore_changes = ignore_changes
+
+            # values of expressions (e.g. F("count") + 1) are known after the update
+            new_values.update(
+                self._get_values(
+                    [obj.pk for obj in objs if obj.pk not in new_values], attnames
+                )
+            )
+
+            content_type = ContentType.objects.get_for_model(self.model)
+            changes = []
+            for obj in objs:
+                old, new = old_values.get(obj.pk), new_values.get(obj.pk)
+                # the row is deleted
+                if old is None or new is None:
+                    continue
+                changed_data = {
+                    a: {"old": old[a], "new": new[a]}
+                    for a in attnames
+                    if new[a] != old[a]
+                }
+                if changed_data:
+                    changes.append(
+                        init_change(obj, changed_data, CHANGED, content_type)
+                    )
+            save_changes(changes, self.db)
+        return rows
+
+    def update(self, **kwargs):
+        if _local.ignore(self.model, None):
+            return super().update(**kwargs)
+        return create_changes_for_update(self, **kwargs)
+
+    def _get_old_values(self, objs, attnames):
+        """
+        Old values are taken from `_logging_attrs` of the objects,
+        values of instances which were not loaded with their pk (e.g. created by `save`)
+        and of the fields which were deferred or not tracked are read from the DB
+        """
+        pk_attname = self.model._meta.pk.attname
+        old_values = {}
+        for obj in objs:
+            logging_attrs = getattr(obj, "_logging_attrs", None)
+            if (
+                logging_attrs is not None
+                and logging_attrs.get(pk_attname) == obj.pk
+                and all(a in logging_attrs for a in attnames)
+            ):
+                old_values[obj.pk] = {a: logging_attrs[a] for a in attnames}
+
+        old_values.update(
+            self._get_values(
+                [obj.pk for obj in objs if obj.pk not in old_values],
+                attnames,
+                lock=True,
+            )
+        )
+        return old_values
+
+    def _get_values(self, pks, attnames, lock=False):
+        if not pks or not attnames:
+            return {pk: {} for pk in pks}
+        queryset = self.model._base_manager.using(self.db).filter(pk__in=pks)
+        if lock:
+            queryset = queryset.select_for_update()
+        return {
+            row[0]: dict(zip(attnames, row[1:]))
+            for row in queryset.values_list("pk", *attnames)
+        }
+
+
+class LoggingQuerySet(LoggingQuerySetMixin, models.QuerySet):
+    pass
+
+
+class LoggingManager(models.Manager.from_queryset(LoggingQuerySet)):
+    pass
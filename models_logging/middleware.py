@@ -1,28 +1,63 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.conf import settings
 from django.core.exceptions import MiddlewareNotUsed
 from django.utils.module_loading import import_string
 
 from models_logging import _local
 from models_logging.settings import MERGE_CHANGES
-from models_logging.utils import create_revision_with_changes
+from models_logging.utils import (
+    acreate_revision_with_changes,
+    create_revision_with_changes,
+)
 
 
 class LoggingStackMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        _local.stack_changes = {}
-        _local.request = request
-        _local.merge_changes_allowed = MERGE_CHANGES_ALLOWED
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        self.start(request)
+        try:
+            response = self.get_response(request)
+            if MERGE_CHANGES and _local.stack_changes:
+                self.create_revision(_local)
+        finally:
+            self.finish()
 
-        response = self.get_response(request)
+        return response
 
-        if MERGE_CHANGES and _local.stack_changes:
-            self.create_revision(_local)
+    async def __acall__(self, request):
+        self.start(request)
+        try:
+            response = await self.get_response(request)
+            if MERGE_CHANGES and _local.stack_changes:
+                await self.acreate_revision(_local)
+        finally:
+            self.finish()
 
         return response
 
+    @staticmethod
+    def start(request):
+        _local.stack_changes = {}
+        _local.request = request
+        _local.merge_changes_allowed = MERGE_CHANGES_ALLOWED
+
+    @staticmethod
+    def finish():
+        # changes of atomic blocks get to the stack only when they are committed,
+        # the ones committed after the request are written without merging
+        _local.stack_changes = {}
+        _local.merge_changes_allowed = False
+
     @staticmethod
     def create_revision(_local):
         # use a dedicated method to be able to override it and call create_revision_with_changes async
@@ -30,16 +65,22 @@ class LoggingStackMiddleware:
         create_revision_with_changes(_local.stack_changes.values())
         _local.stack_changes = {}
 
+    @staticmethod
+    async def acreate_revision(_local):
+        await acreate_revision_with_changes(_local.stack_changes.values())
+        _local.stack_changes = {}
+
 
 MERGE_CHANGES_ALLOWED = False
 for middleware in settings.MIDDLEWARE:
-    try:
-        middleware_cls = import_string(middleware)(object)
-    except MiddlewareNotUsed:
-        continue
-
+    middleware_cls = import_string(middleware)
     if isinstance(middleware_cls, type) and issubclass(
         middleware_cls, LoggingStackMiddleware
     ):
+        try:
+            middleware_cls(object)
+        except MiddlewareNotUsed:
+            continue
+
         MERGE_CHANGES_ALLOWED = True
         break
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("models_logging", "0011_change_db_constraint"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="change",
+            name="object_pk_int",
+            field=models.BigIntegerField(
+                blank=True,
+                help_text="Primary key of the model if it's an integer.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+import django.db.models.deletion
+import models_logging.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("models_logging", "0012_change_object_pk_int"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Checkpoint",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(
+                        help_text="The date of the change.", verbose_name="Date created"
+                    ),
+                ),
+                ("object_id", models.TextField()),
+                (
+                    "data",
+                    models.JSONField(
+                        blank=True,
+                        encoder=models_logging.models.get_encoder,
+                        help_text="Values of fields, empty if the object is deleted.",
+                        null=True,
+                    ),
+                ),
+                (
+                    "change",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="models_logging.change",
+                    ),
+                ),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.contenttype",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Checkpoint",
+                "verbose_name_plural": "Checkpoints",
+                "indexes": [
+                    models.Index(
+                        fields=["content_type", "object_id", "date_created"],
+                        name="models_checkpoint_object",
+                    )
+                ],
+            },
+        ),
+    ]
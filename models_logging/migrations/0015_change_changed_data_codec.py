@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+import models_logging.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("models_logging", "0014_changefield"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="change",
+            name="changed_data",
+            field=models_logging.models.ChangedDataField(
+                blank=True, encoder=models_logging.models.get_encoder, null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations, models
+
+from models_logging.partitions import add_index_concurrently, is_partitioned
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    Builds the index without blocking writes of changes on PostgreSQL,
+    the migration can't be atomic then. Other databases create the index as usual.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != "postgresql":
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            add_index_concurrently(schema_editor, model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        connection = schema_editor.connection
+        # indexes of partitioned tables can't be dropped concurrently
+        if connection.vendor != "postgresql" or is_partitioned(connection):
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("models_logging", "0015_change_changed_data_codec"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="change",
+            index=models.Index(
+                fields=["content_type", "object_pk_int"],
+                name="models_content_type_pk_int",
+            ),
+        ),
+    ]
@@ -1,12 +1,28 @@
+from functools import cache
+from itertools import islice
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models, transaction
-from django.db.models.functions import Cast
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, router
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Cast, FirstValue, RowNumber
 from django.urls import reverse
+from django.utils.dateparse import parse_datetime
 from django.utils.module_loading import import_string
 from django.utils.translation import gettext_lazy as _
 
-from .settings import ADDED, CHANGED, DELETED, LOGGING_USER_MODEL, JSON_ENCODER_PATH
+from . import codec
+from .settings import (
+    ADDED,
+    CHANGED,
+    CHANGED_DATA_CODEC,
+    DELETED,
+    FIELD_INDEX,
+    LOGGING_USER_MODEL,
+    JSON_ENCODER_PATH,
+    USE_INTEGER_OBJECT_PK,
+)
 
 
 def get_encoder(*args, **kwargs):
@@ -14,6 +30,33 @@ def get_encoder(*args, **kwargs):
     return encoder_cls(*args, **kwargs)
 
 
+@cache
+def get_codec():
+    if CHANGED_DATA_CODEC:
+        return import_string(CHANGED_DATA_CODEC)(encoder=get_encoder)
+    return None
+
+
+class ChangedDataField(models.JSONField):
+    """
+    JSONField encoding values by the codec of `LOGGING_CHANGED_DATA_CODEC`,
+    the values are decoded on read, so the codec is transparent for the code reading them
+    """
+
+    def get_prep_value(self, value):
+        changed_data_codec = get_codec()
+        if changed_data_codec is not None and isinstance(value, dict):
+            value = changed_data_codec.encode(value)
+        return super().get_prep_value(value)
+
+    def from_db_value(self, value, expression, connection):
+        value = super().from_db_value(value, expression, connection)
+        # keys and values extracted by queries are not decoded
+        if isinstance(expression, KeyTransform):
+            return value
+        return codec.decode(value)
+
+
 class Revision(models.Model):
     """A group of related changes."""
 
@@ -42,8 +85,331 @@ class Revision(models.Model):
         return reverse("admin:models_logging_revision_change", args=[self.id])
 
     def revert(self):
-        for ch in self.change_set.all():
-            ch.revert()
+        from .revert import revert_changes
+
+        revert_changes(self.change_set.all())
+
+
+def has_integer_pk(model) -> bool:
+    pk = model._meta.pk
+    # multi-table inheritance
+    while pk.remote_field:
+        pk = pk.target_field
+    return isinstance(pk, models.IntegerField)
+
+
+def get_object_pk_int(pk):
+    """:return: value of `Change.object_pk_int` for the pk of a logged object"""
+    if isinstance(pk, int) and not isinstance(pk, bool) and -(2**63) <= pk < 2**63:
+        return pk
+    return None
+
+
+class ChangeQuerySet(models.QuerySet):
+    def for_objects(self, model, pks):
+        """
+        Changes of objects of the model
+        :param pks: list of pks or queryset of the model
+        """
+        return self.filter(self.objects_q(model, pks))
+
+    def objects_q(self, model, pks):
+        """
+        Condition for `for_objects`, conditions of several models can be combined with OR
+        """
+        content_type = ContentType.objects.get_for_model(model)
+        use_int = USE_INTEGER_OBJECT_PK and has_integer_pk(model)
+        if isinstance(pks, models.QuerySet):
+            if not use_int:
+                pks = pks.annotate(pk_str=Cast("pk", output_field=models.TextField()))
+            pks = pks.values_list("pk" if use_int else "pk_str", flat=True)
+            # subqueries can't be used across databases
+            if pks.db != self.db:
+                pks = list(pks)
+        elif not use_int:
+            pks = [str(pk) for pk in pks]
+
+        if use_int:
+            return models.Q(content_type=content_type, object_pk_int__in=pks)
+        return models.Q(content_type=content_type, object_id__in=pks)
+
+    def touching(self, field, model=None):
+        """
+        Changes of the field, looked up by `ChangeField` with `LOGGING_FIELD_INDEX`,
+        by keys of `changed_data` otherwise
+        :param field: attname of the field
+        :param model: model of the field, changes of all models by default
+        """
+        if not FIELD_INDEX:
+            qs = self.filter(changed_data__has_key=field)
+            if model is not None:
+                qs = qs.filter(content_type=ContentType.objects.get_for_model(model))
+            return qs
+
+        change_fields = ChangeField.objects.filter(field_name=field)
+        if model is not None:
+            change_fields = change_fields.filter(
+                content_type=ContentType.objects.get_for_model(model)
+            )
+        return self.filter(pk__in=change_fields.values("change_id"))
+
+    def keyset_page(self, size, after=None, latest_first=False):
+        """
+        Page of changes ordered by (date_created, pk), unlike OFFSET
+        the cost of a page doesn't depend on the number of previous pages
+        :param after: cursor of the previous page
+        :return: list of changes and cursor of the next page, None for the last page
+        """
+        lookup = "lt" if latest_first else "gt"
+        qs = self.order_by(
+            *(("-date_created", "-pk") if latest_first else ("date_created", "pk"))
+        )
+        if after:
+            date_created, pk = self.parse_cursor(after)
+            qs = qs.filter(
+                models.Q(**{"date_created__%s" % lookup: date_created})
+                | models.Q(date_created=date_created, **{"pk__%s" % lookup: pk})
+            )
+        changes = list(qs[: size + 1])
+        if len(changes) > size:
+            last = changes[size - 1]
+            return changes[:size], "%s_%s" % (last.date_created.isoformat(), last.pk)
+        return changes, None
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """:return: date_created and pk of the cursor, ValueError if it's invalid"""
+        date_created, _, pk = cursor.rpartition("_")
+        date_created = parse_datetime(date_created)
+        if date_created is None:
+            raise ValueError("Invalid cursor %r" % cursor)
+        return date_created, int(pk)
+
+    def state_at(self, obj, when):
+        """
+        State of the object at the date
+        :param obj: instance of a logged model or tuple of (model, pk)
+        :return: dict of field values as they're stored in `changed_data`,
+        None if the object didn't exist
+        """
+        model, pk = obj if isinstance(obj, tuple) else (obj.__class__, obj.pk)
+        return next(self.states_at(model, [pk], when))[1]
+
+    def states_at(self, model, pks, when, chunk_size=1000):
+        """
+        States of objects at the date, every state is built from the latest checkpoint
+        of the object before the date and changes after the checkpoint
+        :param pks: list of pks or queryset of the model
+        :param chunk_size: number of objects processed by one pair of queries
+        :return: iterator of (pk, state) as in `state_at`
+        """
+        content_type = ContentType.objects.get_for_model(model)
+        if isinstance(pks, models.QuerySet):
+            pks = pks.values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+        pks = iter(pks)
+        while chunk := list(islice(pks, chunk_size)):
+            states = self.replay(content_type, [str(pk) for pk in chunk], when)
+            for pk in chunk:
+                yield pk, states[str(pk)][0]
+
+    def values_as_of(self, model, pks, when, fields=None, chunk_size=1000):
+        """
+        Values of fields of objects at the date, the last change of every field
+        is found by window functions, so no history is replayed.
+        Objects without changes before the date or deleted at the date are skipped,
+        fields without changes since the object was added are None.
+        :param pks: list of pks or queryset of the model
+        :param fields: attnames of logged fields, all logged fields by default
+        :param chunk_size: number of objects processed by one pair of queries
+        :return: iterator of dicts with "pk" and values of fields
+        """
+        from .helpers import get_logging_plan
+
+        fields = list(fields or get_logging_plan(model).attnames)
+        content_type = ContentType.objects.get_for_model(model)
+        if isinstance(pks, models.QuerySet):
+            pks = pks.values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+        pks = iter(pks)
+        while chunk := list(islice(pks, chunk_size)):
+            rows = self._last_changes(model, content_type, chunk, when, fields)
+            # json is decoded in python, json values extracted by databases lose types
+            data = dict(
+                self.filter(
+                    pk__in={pk for row in rows.values() for pk in row[1:] if pk}
+                ).values_list("pk", "changed_data")
+            )
+            for pk in chunk:
+                try:
+                    action, *change_ids = rows[str(pk)]
+                except KeyError:
+                    continue
+                if action == DELETED:
+                    continue
+                values = {"pk": pk}
+                for field, change_id in zip(fields, change_ids):
+                    values[field] = ((data.get(change_id) or {}).get(field) or {}).get(
+                        "new"
+                    )
+                yield values
+
+    def _last_changes(self, model, content_type, pks, when, fields):
+        """
+        :return: dict of object_id: (action of the last change, ids of the last changes of fields)
+        """
+        last_added = (
+            self.filter(
+                content_type=content_type,
+                object_id=models.OuterRef("object_id"),
+                action=ADDED,
+                date_created__lte=when,
+            )
+            .order_by("-date_created")
+            .values("date_created")[:1]
+        )
+        windows = {
+            "field_%s" % i: models.Window(
+                FirstValue("pk"),
+                partition_by="object_id",
+                order_by=(
+                    # changes of the field first
+                    models.Case(
+                        models.When(changed_data__has_key=field, then=1),
+                        default=0,
+                    ).desc(),
+                    "-date_created",
+                    "-pk",
+                ),
+            )
+            for i, field in enumerate(fields)
+        }
+        rows = (
+            self.filter(self.objects_q(model, pks), date_created__lte=when)
+            .annotate(last_added=models.Subquery(last_added))
+            .filter(
+                models.Q(last_added__isnull=True)
+                | models.Q(date_created__gte=models.F("last_added"))
+            )
+            .annotate(
+                row_number=models.Window(
+                    RowNumber(),
+                    partition_by="object_id",
+                    order_by=("-date_created", "-pk"),
+                ),
+                **windows,
+            )
+            .filter(row_number=1)
+            .values_list("object_id", "action", *windows)
+        )
+        return {object_id: row for object_id, *row in rows}
+
+    def replay(self, content_type, object_ids, when):
+        """
+        Applies changes up to the date to the latest checkpoints of objects
+        :return: dict of object_id: (state, the last applied change or checkpoint)
+        """
+        checkpoints = (
+            Checkpoint.objects.using(self.db)
+            .filter(
+                content_type=content_type,
+                object_id__in=object_ids,
+                date_created__lte=when,
+            )
+            .annotate(
+                row_number=models.Window(
+                    RowNumber(),
+                    partition_by="object_id",
+                    order_by=("-date_created", "-change_id"),
+                )
+            )
+            .filter(row_number=1)
+        )
+        states = dict.fromkeys(object_ids, (None, None))
+        for checkpoint in checkpoints:
+            states[checkpoint.object_id] = (checkpoint.data, checkpoint)
+
+        checkpoint_date = (
+            Checkpoint.objects.filter(
+                content_type=content_type,
+                object_id=models.OuterRef("object_id"),
+                date_created__lte=when,
+            )
+            .order_by("-date_created")
+            .values("date_created")[:1]
+        )
+        changes = (
+            self.filter(
+                self.objects_q(content_type.model_class(), object_ids),
+                date_created__lte=when,
+            )
+            .annotate(checkpoint_date=models.Subquery(checkpoint_date))
+            .filter(
+                models.Q(checkpoint_date__isnull=True)
+                | models.Q(date_created__gte=models.F("checkpoint_date"))
+            )
+            .only("object_id", "date_created", "action", "changed_data")
+            .order_by("date_created", "pk")
+        )
+        for change in changes.iterator():
+            state, last = states[change.object_id]
+            if isinstance(last, Checkpoint) and (
+                change.date_created,
+                change.pk,
+            ) <= (last.date_created, last.change_id or 0):
+                continue
+            states[change.object_id] = (replay_change(state, change), change)
+        return states
+
+    def with_related(self, *fields):
+        """
+        select_related for relations stored in the same database as changes,
+        prefetch_related for the rest (e.g. with `LOGGING_DATABASE`)
+        """
+        select, prefetch = [], []
+        for name in fields:
+            related_model = self.model._meta.get_field(name).related_model
+            if router.db_for_read(related_model) == self.db:
+                select.append(name)
+            else:
+                prefetch.append(name)
+        qs = self.select_related(*select) if select else self
+        return qs.prefetch_related(*prefetch)
+
+
+def replay_change(state, change):
+    """
+    :param state: dict of field values, None if the object doesn't exist
+    :return: state after the change
+    """
+    new = {k: v.get("new") for k, v in (change.changed_data or {}).items()}
+    if change.action == ADDED:
+        return new
+    if change.action == DELETED:
+        return None
+    return {**(state or {}), **new}
+
+
+class LoggedObjectForeignKey(GenericForeignKey):
+    """
+    Reads the logged object from the database chosen by routers,
+    not from the database of the change
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        if not self.is_cached(instance):
+            rel_obj = None
+            ct_id = getattr(instance, self.model._meta.get_field(self.ct_field).attname)
+            model_class = ct_id and ContentType.objects.get_for_id(ct_id).model_class()
+            if model_class is not None:
+                try:
+                    rel_obj = model_class._base_manager.db_manager(
+                        hints={"instance": instance}
+                    ).get(pk=getattr(instance, self.fk_field))
+                except ObjectDoesNotExist:
+                    pass
+            self.set_cached_value(instance, rel_obj)
+        return self.get_cached_value(instance)
 
 
 class Change(models.Model):
@@ -56,6 +422,10 @@ class Change(models.Model):
                 fields=("content_type", "object_id"),
                 name="models_content_type_object_id",
             ),
+            models.Index(
+                fields=("content_type", "object_pk_int"),
+                name="models_content_type_pk_int",
+            ),
         ]
 
     ACTIONS = ((ADDED, _("Added")), (CHANGED, _("Changed")), (DELETED, _("Deleted")))
@@ -71,6 +441,7 @@ class Change(models.Model):
         blank=True,
         null=True,
         on_delete=models.SET_NULL,
+        db_constraint=False,
         verbose_name=_("User"),
         help_text=_("The user who created this changes."),
     )
@@ -80,10 +451,11 @@ class Change(models.Model):
     content_type = models.ForeignKey(
         ContentType,
         on_delete=models.CASCADE,
+        db_constraint=False,
         help_text="Content type of the model under version control.",
     )
-    object = GenericForeignKey(ct_field="content_type", fk_field="object_id")
-    changed_data = models.JSONField(blank=True, null=True, encoder=get_encoder)
+    object = LoggedObjectForeignKey(ct_field="content_type", fk_field="object_id")
+    changed_data = ChangedDataField(blank=True, null=True, encoder=get_encoder)
 
     object_repr = models.TextField(
         help_text=_("A string representation of the object.")
@@ -103,6 +475,13 @@ class Change(models.Model):
         db_index=True,
     )
     extras = models.JSONField(blank=True, default=dict, encoder=get_encoder, null=True)
+    object_pk_int = models.BigIntegerField(
+        blank=True,
+        null=True,
+        help_text=_("Primary key of the model if it's an integer."),
+    )
+
+    objects = ChangeQuerySet.as_manager()
 
     def __str__(self):
         return "Changes %s of %s <%s>" % (
@@ -120,55 +499,26 @@ class Change(models.Model):
         :return: queryset of Changes
         """
 
-        base_qs = Change.objects.select_related("user")
-        changes_qs = base_qs.filter(
-            content_type=ContentType.objects.get_for_model(obj.__class__),
-            object_id=obj.pk,
-        )
+        base_qs = Change.objects.with_related("user")
+        # one query with an OR of indexed conditions, related pks are subqueries
+        condition = base_qs.objects_q(obj.__class__, [obj.pk])
         for rel_model in related_models:
             if isinstance(rel_model, models.OneToOneRel):
-                try:
-                    changes_qs = changes_qs.union(
-                        base_qs.filter(
-                            content_type=ContentType.objects.get_for_model(
-                                rel_model.related_model
-                            ),
-                            object_id=getattr(obj, rel_model.get_accessor_name()).pk,
-                        )
-                    )
-                except rel_model.related_model.DoesNotExist:
-                    continue
-            elif isinstance(rel_model, models.ManyToOneRel):
-                rel_objects_qs = (
-                    getattr(obj, rel_model.get_accessor_name())
-                    .annotate(pk_str=Cast("pk", output_field=models.TextField()))
-                    .values("pk_str")
-                )
-                changes_qs = changes_qs.union(
-                    base_qs.filter(
-                        content_type=ContentType.objects.get_for_model(
-                            rel_model.related_model
-                        ),
-                        object_id__in=rel_objects_qs,
-                    )
+                rel_objects = rel_model.related_model._base_manager.filter(
+                    **{rel_model.field.name: obj}
                 )
+            elif isinstance(rel_model, models.ManyToOneRel):
+                rel_objects = getattr(obj, rel_model.get_accessor_name()).all()
+            else:
+                continue
+            condition |= base_qs.objects_q(rel_model.related_model, rel_objects)
 
-        return changes_qs.order_by("date_created")
+        return base_qs.filter(condition).order_by("date_created")
 
     def revert(self):
-        with transaction.atomic():
-            data = {
-                field: values.get("old") for field, values in self.changed_data.items()
-            }
-            if self.action == ADDED:
-                self.object.delete()
-            elif self.action == CHANGED:
-                for k, v in data.items():
-                    setattr(self.object, k, v)
-                self.object.save()
-            else:
-                obj = self.changes_model_class()(**data)
-                obj.save()
+        from .revert import revert_changes
+
+        revert_changes([self])
 
     def changes_model_class(self):
         return self.content_type.model_class()
@@ -179,3 +529,89 @@ class Change(models.Model):
     @classmethod
     def user_field_model(cls):
         return cls._meta.get_field("user").related_model
+
+
+class ChangeField(models.Model):
+    """
+    Name of a field changed by a change, written with `LOGGING_FIELD_INDEX`,
+    so changes of a field are found by an index instead of a scan of `changed_data`
+    """
+
+    class Meta:
+        verbose_name = _("Changed field")
+        verbose_name_plural = _("Changed fields")
+        indexes = [
+            models.Index(
+                fields=("field_name", "content_type", "change"),
+                name="models_change_field",
+            ),
+        ]
+
+    # changes can be deleted and partitioned, so neither this model nor `Checkpoint`
+    # reference them by constraints
+    change = models.ForeignKey(
+        Change, on_delete=models.CASCADE, db_constraint=False, related_name="fields"
+    )
+    content_type = models.ForeignKey(
+        ContentType, on_delete=models.CASCADE, db_constraint=False
+    )
+    field_name = models.CharField(max_length=255)
+
+    def __str__(self):
+        return self.field_name
+
+    @classmethod
+    def for_changes(cls, changes):
+        """:return: unsaved rows of saved changes"""
+        return [
+            cls(
+                change_id=change.pk,
+                content_type_id=change.content_type_id,
+                field_name=field_name,
+            )
+            for change in changes
+            if change.pk is not None
+            for field_name in change.changed_data or ()
+        ]
+
+
+class Checkpoint(models.Model):
+    """
+    Full state of an object after a change,
+    states of objects at a date are replayed from the latest checkpoints
+    """
+
+    class Meta:
+        verbose_name = _("Checkpoint")
+        verbose_name_plural = _("Checkpoints")
+        indexes = [
+            models.Index(
+                fields=("content_type", "object_id", "date_created"),
+                name="models_checkpoint_object",
+            ),
+        ]
+
+    date_created = models.DateTimeField(
+        _("Date created"), help_text=_("The date of the change.")
+    )
+    content_type = models.ForeignKey(
+        ContentType, on_delete=models.CASCADE, db_constraint=False
+    )
+    object_id = models.TextField()
+    change = models.ForeignKey(
+        Change,
+        blank=True,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    data = models.JSONField(
+        blank=True,
+        null=True,
+        encoder=get_encoder,
+        help_text=_("Values of fields, empty if the object is deleted."),
+    )
+
+    def __str__(self):
+        return "Checkpoint %s of %s" % (self.id, self.date_created)
@@ -0,0 +1,334 @@
+"""
+Range partitioning of the `Change` table by `date_created` (PostgreSQL only).
+
+Partitions are monthly, `<table>_pYYYY_MM`, they are created ahead of time
+by the `partition_changes` command, rows out of their ranges go to `<table>_default`.
+The primary key of a partitioned table must include the partition key,
+so it's (id, date_created) in the database, Django still uses `id`.
+"""
+
+import re
+from collections import namedtuple
+
+from dateutil.relativedelta import relativedelta
+from django.db import NotSupportedError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from models_logging.models import Change
+
+Partition = namedtuple("Partition", ["name", "lower", "upper", "default"])
+
+_BOUND_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def validate_months(months):
+    """
+    `months` sets the number of partitions created in a loop,
+    the SQL of partitions is built by string formatting
+    """
+    if isinstance(months, bool) or not isinstance(months, int) or months < 0:
+        raise ValueError("months must be a non-negative integer, got %r" % (months,))
+
+
+def is_partitioned(connection) -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [Change._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions(connection):
+    """
+    :return: list of Partition, lower and upper are None for MINVALUE/MAXVALUE
+    """
+
+    def parse_bound(value):
+        if value in ("MINVALUE", "MAXVALUE"):
+            return None
+        return parse_datetime(value.strip("'"))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+            [Change._meta.db_table],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound)
+        if match:
+            lower, upper = map(parse_bound, match.groups())
+            partitions.append(Partition(name, lower, upper, False))
+        else:
+            partitions.append(Partition(name, None, None, True))
+    return partitions
+
+
+def add_index_concurrently(editor, model, index):
+    """
+    Creates an index of changes without blocking writes on PostgreSQL:
+    concurrently on a plain table, on a partitioned table the index of the parent
+    is created ON ONLY it, indexes of partitions are created concurrently
+    and attached to it. Can't be run in a transaction.
+    """
+    if not is_partitioned(editor.connection):
+        editor.add_index(model, index, concurrently=True)
+        return
+
+    qn = editor.quote_name
+    columns = ", ".join(
+        "%s %s" % (qn(model._meta.get_field(field).column), order or "ASC")
+        for field, order in index.fields_orders
+    )
+    editor.execute(
+        "CREATE INDEX IF NOT EXISTS %s ON ONLY %s (%s)"
+        % (qn(index.name), qn(model._meta.db_table), columns)
+    )
+    for partition in get_partitions(editor.connection):
+        name = editor._create_index_name(partition.name, [index.name], suffix="idx")
+        editor.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s (%s)"
+            % (qn(name), qn(partition.name), columns)
+        )
+        editor.execute(
+            "ALTER INDEX %s ATTACH PARTITION %s" % (qn(index.name), qn(name))
+        )
+
+
+def create_partitions(connection, months=3, start=None):
+    """
+    Creates monthly partitions from the month of `start` (now by default)
+    and `months` months ahead, months covered by existing partitions are skipped
+    :return: names of created partitions
+    """
+    validate_months(months)
+    table = Change._meta.db_table
+    qn = connection.ops.quote_name
+    existing = [p for p in get_partitions(connection) if not p.default]
+    lower = month_start(start or timezone.now())
+
+    created = []
+    with connection.schema_editor() as editor:
+        for _ in range(months + 1):
+            upper = lower + relativedelta(months=1)
+            if not any(
+                (p.lower is None or p.lower < upper)
+                and (p.upper is None or lower < p.upper)
+                for p in existing
+            ):
+                name = "%s_p%s" % (table, lower.strftime("%Y_%m"))
+                editor.execute(
+                    "CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%%s) TO (%%s)"
+                    % (qn(name), qn(table)),
+                    [lower, upper],
+                )
+                created.append(name)
+            lower = upper
+    return created
+
+
+def drop_partitions(connection, before):
+    """
+    Detaches and drops partitions which contain only rows older than `before`
+    :return: names of dropped partitions
+    """
+    if not is_partitioned(connection):
+        return []
+
+    table = Change._meta.db_table
+    qn = connection.ops.quote_name
+    dropped = []
+    for partition in get_partitions(connection):
+        if partition.upper is not None and partition.upper <= before:
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "ALTER TABLE %s DETACH PARTITION %s"
+                        % (qn(table), qn(partition.name))
+                    )
+                    cursor.execute("DROP TABLE %s" % qn(partition.name))
+            dropped.append(partition.name)
+    return dropped
+
+
+def convert_to_partitioned(connection, months=3):
+    """
+    Converts the existing table to a partitioned one, the table is renamed
+    to `<table>_old` and attached as the partition of rows created before
+    the month after the next one (the conversion can take longer than the month).
+    The expensive part is done without blocking writes:
+    a CHECK constraint of the partition range is added NOT VALID and validated,
+    the unique index (id, date_created) of the new primary key is built concurrently.
+    Then a short transaction holding ACCESS EXCLUSIVE lock swaps the primary key
+    to that index and attaches the table, PostgreSQL proves the range
+    by the constraint and attaches existing indexes instead of scanning the table.
+    Can't be run in a transaction.
+    """
+    validate_months(months)
+    table = Change._meta.db_table
+    old_table = "%s_old" % table
+    pk_column = Change._meta.pk.column
+    date_column = Change._meta.get_field("date_created").column
+    check_name = "%s_range_check" % table[:51]
+    pk_index = "%s_id_date_uniq" % table[:47]
+    qn = connection.ops.quote_name
+    upper = month_start(timezone.now()) + relativedelta(months=2)
+    if connection.in_atomic_block:
+        raise NotSupportedError("The table can't be converted in a transaction")
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND conname = %s",
+            [table, check_name],
+        )
+        check_exists = cursor.fetchone() is not None
+        # an index left invalid by a failed concurrent build is dropped
+        cursor.execute(
+            "SELECT x.indisvalid FROM pg_index x WHERE x.indexrelid = to_regclass(%s)",
+            [pk_index],
+        )
+        pk_index_state = cursor.fetchone()
+
+    with connection.schema_editor(atomic=False) as editor:
+        if check_exists:
+            # left by a previous run, the bound could be another month
+            editor.execute(
+                "ALTER TABLE %s DROP CONSTRAINT %s" % (qn(table), qn(check_name))
+            )
+        editor.execute(
+            "ALTER TABLE %s ADD CONSTRAINT %s CHECK (%s IS NOT NULL AND %s < %%s) "
+            "NOT VALID" % (qn(table), qn(check_name), qn(date_column), qn(date_column)),
+            [upper],
+        )
+        editor.execute(
+            "ALTER TABLE %s VALIDATE CONSTRAINT %s" % (qn(table), qn(check_name))
+        )
+        if pk_index_state is not None and not pk_index_state[0]:
+            editor.execute("DROP INDEX CONCURRENTLY %s" % qn(pk_index))
+        editor.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s (%s, %s)"
+            % (qn(pk_index), qn(table), qn(pk_column), qn(date_column))
+        )
+
+    with transaction.atomic(using=connection.alias):
+        with connection.schema_editor(atomic=False) as editor:
+            editor.execute("LOCK TABLE %s IN ACCESS EXCLUSIVE MODE" % qn(table))
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT conname FROM pg_constraint "
+                    "WHERE conrelid = to_regclass(%s) AND contype = 'p'",
+                    [table],
+                )
+                pk_name = cursor.fetchone()[0]
+            # the columns are NOT NULL, the index becomes the primary key without a scan
+            editor.execute(
+                "ALTER TABLE %s DROP CONSTRAINT %s" % (qn(table), qn(pk_name))
+            )
+            editor.execute(
+                "ALTER TABLE %s ADD CONSTRAINT %s PRIMARY KEY USING INDEX %s"
+                % (qn(table), qn(pk_name), qn(pk_index))
+            )
+
+            # index names are unique per schema, the new table gets the original ones
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT i.relname FROM pg_index x "
+                    "JOIN pg_class i ON i.oid = x.indexrelid "
+                    "WHERE x.indrelid = to_regclass(%s)",
+                    [table],
+                )
+                indexes = [row[0] for row in cursor.fetchall()]
+                cursor.execute(
+                    "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                    "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+                    [table],
+                )
+                foreign_keys = cursor.fetchall()
+                cursor.execute(
+                    "SELECT pg_get_serial_sequence(%s, %s), a.attidentity "
+                    "FROM pg_attribute a "
+                    "WHERE a.attrelid = to_regclass(%s) AND a.attname = %s",
+                    [table, pk_column, table, pk_column],
+                )
+                sequence, identity = cursor.fetchone()
+
+            for index in indexes:
+                editor.execute(
+                    "ALTER INDEX %s RENAME TO %s" % (qn(index), qn(index[:59] + "_old"))
+                )
+            editor.execute("ALTER TABLE %s RENAME TO %s" % (qn(table), qn(old_table)))
+            editor.execute(
+                "CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS) "
+                "PARTITION BY RANGE (%s)" % (qn(table), qn(old_table), qn(date_column))
+            )
+
+            # the sequence must be owned by the new table,
+            # it's dropped with the old partition otherwise
+            if identity:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT nextval(%s)", [sequence])
+                    next_value = cursor.fetchone()[0]
+                editor.execute(
+                    "ALTER TABLE %s ALTER COLUMN %s DROP IDENTITY"
+                    % (qn(old_table), qn(pk_column))
+                )
+                editor.execute(
+                    "CREATE SEQUENCE %s START WITH %s OWNED BY %s.%s"
+                    % (sequence, int(next_value), qn(table), qn(pk_column))
+                )
+                editor.execute(
+                    "ALTER TABLE %s ALTER COLUMN %s SET DEFAULT nextval(%s::regclass)"
+                    % (qn(table), qn(pk_column), editor.quote_value(sequence))
+                )
+            else:
+                editor.execute(
+                    "ALTER SEQUENCE %s OWNED BY %s.%s"
+                    % (sequence, qn(table), qn(pk_column))
+                )
+                editor.execute(
+                    "ALTER TABLE %s ALTER COLUMN %s DROP DEFAULT"
+                    % (qn(old_table), qn(pk_column))
+                )
+
+            # the table has no partitions yet, indexes and constraints are created
+            # instantly, equal ones of the old table are attached to them
+            editor.execute(
+                "ALTER TABLE %s ADD CONSTRAINT %s PRIMARY KEY (%s, %s)"
+                % (qn(table), qn(pk_name), qn(pk_column), qn(date_column))
+            )
+            for statement in editor._model_indexes_sql(Change):
+                editor.execute(statement)
+            for name, definition in foreign_keys:
+                editor.execute(
+                    "ALTER TABLE %s ADD CONSTRAINT %s %s"
+                    % (qn(table), qn(name), definition)
+                )
+
+            editor.execute(
+                "ALTER TABLE %s ATTACH PARTITION %s FOR VALUES FROM (MINVALUE) TO (%%s)"
+                % (qn(table), qn(old_table)),
+                [upper],
+            )
+            editor.execute(
+                "ALTER TABLE %s DROP CONSTRAINT %s" % (qn(old_table), qn(check_name))
+            )
+            editor.execute(
+                "CREATE TABLE %s PARTITION OF %s DEFAULT"
+                % (qn("%s_default" % table), qn(table))
+            )
+
+        create_partitions(connection, months, start=upper)
@@ -0,0 +1,132 @@
+from contextlib import ExitStack
+from itertools import groupby
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import router, transaction
+
+from models_logging import _local
+from models_logging.helpers import init_change, model_to_dict
+from models_logging.settings import ADDED, CHANGED, DELETED
+from models_logging.writers import save_changes
+
+
+def revert_changes(changes):
+    """
+    Reverts changes with a few queries per model instead of a query per change:
+    objects are fetched by one `in_bulk`, changed objects are restored by `bulk_update`,
+    deleted objects are re-created by `bulk_create`, added objects are deleted by one query.
+    Changes of the reverting are saved as one batch, model signals are not logged.
+    :param changes: changes of one or several objects, e.g. `revision.change_set.all()`
+    """
+    by_object = {}
+    for change in sorted(changes, key=lambda c: c.pk, reverse=True):
+        key = (change.content_type_id, change.object_id)
+        by_object.setdefault(key, []).append(change)
+
+    models = {}
+    for content_type_id, keys in groupby(sorted(by_object), key=lambda k: k[0]):
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is not None:
+            models[model] = {
+                object_id: by_object[k, object_id] for k, object_id in keys
+            }
+
+    with ExitStack() as stack:
+        for using in {router.db_for_write(model) for model in models}:
+            stack.enter_context(transaction.atomic(using=using))
+        for model, object_changes in models.items():
+            revert_model_changes(model, object_changes)
+
+
+def revert_model_changes(model, object_changes):
+    """
+    :param object_changes: changes of objects of the model by object_id, latest first
+    """
+    using = router.db_for_write(model)
+    pk_field = model._meta.pk
+    content_type = ContentType.objects.get_for_model(model)
+    objects = model._base_manager.using(using).in_bulk(
+        [pk_field.to_python(object_id) for object_id in object_changes]
+    )
+    fields = {f.attname: f for f in model._meta.concrete_fields}
+
+    to_delete, to_update, to_create = [], [], []
+    update_fields = set()
+    reverted = []
+    for object_id, changes in object_changes.items():
+        # old values of the earliest change win, values are decoded from json
+        data = {}
+        for change in changes:
+            data.update(
+                (k, fields[k].to_python(v.get("old")))
+                for k, v in (change.changed_data or {}).items()
+                if k in fields
+            )
+        earliest_action = changes[-1].action
+        obj = objects.get(pk_field.to_python(object_id))
+
+        if obj is None:
+            # only a deletion holds all values of the object including the pk,
+            # objects deleted after the reverted changes are skipped
+            if earliest_action == DELETED:
+                obj = model(**data)
+                to_create.append(obj)
+        elif earliest_action == ADDED:
+            to_delete.append(obj)
+            data = model_to_dict(obj, DELETED)
+            reverted.append((obj, DELETED, {k: {"old": v} for k, v in data.items()}))
+        else:
+            old = model_to_dict(obj)
+            for k, v in data.items():
+                setattr(obj, k, v)
+            new = model_to_dict(obj)
+            changed_data = {
+                k: {"old": old[k], "new": v} for k, v in new.items() if v != old.get(k)
+            }
+            if changed_data:
+                to_update.append(obj)
+                update_fields.update(changed_data)
+                reverted.append((obj, CHANGED, changed_data))
+
+    update_fields.discard(pk_field.attname)
+    log_changes = not _local.ignore(model, None)
+    ignore_changes = _local.ignore_changes
+    if ignore_changes is not True:
+        _local.ignore_changes = [*(ignore_changes or []), model]
+    try:
+        manager = model._base_manager.using(using)
+        if to_delete:
+            manager.filter(pk__in=[obj.pk for obj in to_delete]).delete()
+        if to_update and update_fields:
+            manager.bulk_update(to_update, update_fields)
+        if to_create:
+            if model._meta.parents:
+                # bulk_create doesn't support multi-table inheritance
+                for obj in to_create:
+                    obj.save(using=using, force_insert=True)
+            else:
+                manager.bulk_create(to_create)
+    finally:
+        _local.ignore_changes = ignore_changes
+
+    if not log_changes:
+        return
+    for obj in to_create:
+        reverted.append(
+            (
+                obj,
+                ADDED,
+                {
+                    k: {"old": None, "new": v}
+                    for k, v in model_to_dict(obj).items()
+                    if v is not None
+                },
+            )
+        )
+    save_changes(
+        [
+            init_change(obj, changed_data, action, content_type)
+            for obj, action, changed_data in reverted
+        ],
+        using,
+    )
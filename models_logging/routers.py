@@ -0,0 +1,38 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from models_logging import settings
+
+APP_LABEL = "models_logging"
+
+
+class LoggingRouter:
+    """
+    Routes changes and revisions to `LOGGING_DATABASE`,
+    should be the last one in DATABASE_ROUTERS:
+    DATABASE_ROUTERS = [..., "models_logging.routers.LoggingRouter"]
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == APP_LABEL:
+            return settings.DATABASE
+        # relations of changes (user, content_type, the logged object)
+        # are read from the default database instead of the database of the change
+        instance = hints.get("instance")
+        if instance is not None and instance._meta.app_label == APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == APP_LABEL:
+            return settings.DATABASE
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if APP_LABEL in (obj1._meta.app_label, obj2._meta.app_label):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if settings.DATABASE and app_label == APP_LABEL:
+            return db == settings.DATABASE
+        return None
@@ -15,6 +15,34 @@ CAN_DELETE_CHANGES = getattr(settings, "LOGGING_CAN_DELETE_CHANGES", False)
 CAN_CHANGE_CHANGES = getattr(settings, "LOGGING_CAN_CHANGE_CHANGES", False)
 CHANGES_REVISION_LIMIT = getattr(settings, "LOGGING_CHANGES_REVISION_LIMIT", 100)
 MERGE_CHANGES = getattr(settings, "LOGGING_MERGE_CHANGES", True)
+# estimators of changelist counts, see `models_logging.counts`
+COUNT_ESTIMATORS = getattr(
+    settings,
+    "LOGGING_COUNT_ESTIMATORS",
+    ["models_logging.counts.table_estimate", "models_logging.counts.explain_estimate"],
+)
+# smaller estimates are replaced by the exact count
+COUNT_ESTIMATE_THRESHOLD = getattr(settings, "LOGGING_COUNT_ESTIMATE_THRESHOLD", 10000)
+COUNT_CACHE_TIMEOUT = getattr(settings, "LOGGING_COUNT_CACHE_TIMEOUT", 60)
+COUNT_LIMIT = getattr(settings, "LOGGING_COUNT_LIMIT", 10000)
+# alias of the database for changes and revisions, used by `models_logging.routers.LoggingRouter`
+DATABASE = getattr(settings, "LOGGING_DATABASE", None)
+# filter changes by `Change.object_pk_int` instead of `object_id` for integer pks
+USE_INTEGER_OBJECT_PK = getattr(settings, "LOGGING_USE_INTEGER_OBJECT_PK", False)
+# write names of changed fields to `ChangeField` for `Change.objects.touching`
+FIELD_INDEX = getattr(settings, "LOGGING_FIELD_INDEX", False)
+LAZY_SNAPSHOTS = getattr(settings, "LOGGING_LAZY_SNAPSHOTS", False)
+DEFER_TO_COMMIT = getattr(settings, "LOGGING_DEFER_TO_COMMIT", False)
+
+WRITE_BEHIND = getattr(settings, "LOGGING_WRITE_BEHIND", False)
+WRITE_BEHIND_BATCH_SIZE = getattr(settings, "LOGGING_WRITE_BEHIND_BATCH_SIZE", 500)
+WRITE_BEHIND_MAX_SIZE = getattr(settings, "LOGGING_WRITE_BEHIND_MAX_SIZE", 10000)
+# seconds, 0 disables writing by interval
+WRITE_BEHIND_FLUSH_INTERVAL = getattr(
+    settings, "LOGGING_WRITE_BEHIND_FLUSH_INTERVAL", 5
+)
+# block|drop|sync
+WRITE_BEHIND_OVERFLOW = getattr(settings, "LOGGING_WRITE_BEHIND_OVERFLOW", "sync")
 
 ADDED = "added"
 CHANGED = "changed"
@@ -26,6 +54,9 @@ JSON_ENCODER_PATH = getattr(
     settings, "LOGGING_JSON_ENCODER", "models_logging.utils.ExtendedEncoder"
 )
 
+# e.g. "models_logging.codec.CompactCodec", changed_data is stored as is by default
+CHANGED_DATA_CODEC = getattr(settings, "LOGGING_CHANGED_DATA_CODEC", None)
+
 GET_CHANGE_EXTRAS_PATH = getattr(
     settings,
     "LOGGING_GET_CHANGE_EXTRAS_FUNC",
@@ -1,8 +1,15 @@
 from django.db.models.signals import post_init, post_save, pre_delete, pre_save
 from django.apps.registry import apps
 
-from .settings import MODELS_FOR_LOGGING, MODELS_FOR_EXCLUDE
-from .signals import init_model_attrs, save_model, delete_model, update_model_attrs
+from .helpers import LazyLoggingAttrs, get_logging_plan
+from .settings import MODELS_FOR_LOGGING, MODELS_FOR_EXCLUDE, LAZY_SNAPSHOTS
+from .signals import (
+    init_model_attrs,
+    init_model_attrs_lazy,
+    save_model,
+    delete_model,
+    update_model_attrs,
+)
 
 
 def models_register():
@@ -20,7 +27,12 @@ def models_register():
                 registered_models.append(apps.get_registered_model(item[-2], item[-1]))
 
         for model in registered_models:
-            post_init.connect(init_model_attrs, sender=model)
+            get_logging_plan(model)
+            if LAZY_SNAPSHOTS:
+                model._logging_attrs = LazyLoggingAttrs()
+                post_init.connect(init_model_attrs_lazy, sender=model)
+            else:
+                post_init.connect(init_model_attrs, sender=model)
             pre_save.connect(update_model_attrs, sender=model)
             post_save.connect(save_model, sender=model)
             pre_delete.connect(delete_model, sender=model)
@@ -1,8 +1,9 @@
 from django.contrib.contenttypes.models import ContentType
 
 from . import _local
-from .helpers import model_to_dict, get_changed_data, init_change
-from .settings import ADDED, CHANGED, DELETED, MERGE_CHANGES
+from .helpers import model_to_dict, get_changed_data, init_change, take_snapshot
+from .settings import ADDED, CHANGED, DELETED
+from .writers import save_changes
 
 
 def init_model_attrs(sender, instance, **kwargs):
@@ -15,21 +16,27 @@ def init_model_attrs(sender, instance, **kwargs):
         instance._logging_attrs = model_dict
 
 
+def init_model_attrs_lazy(sender, instance, **kwargs):
+    if not _local.ignore(sender, instance):
+        instance._logging_snapshot = take_snapshot(instance)
+
+
 def save_model(sender, instance, using, **kwargs):
     if not _local.ignore(sender, instance):
-        diffs = get_changed_data(instance)
-        if diffs:
-            action = ADDED if kwargs.get("created") else CHANGED
-            _create_changes(instance, action)
+        action = ADDED if kwargs.get("created") else CHANGED
+        changed_data = get_changed_data(instance, action)
+        if changed_data:
+            _create_changes(instance, action, changed_data, using)
 
 
 def delete_model(sender, instance, using, **kwargs):
     if not _local.ignore(sender, instance):
-        _create_changes(instance, DELETED)
+        _create_changes(instance, DELETED, using=using)
 
 
-def _create_changes(object, action):
-    changed_data = get_changed_data(object, action)
+def _create_changes(object, action, changed_data=None, using=None):
+    if changed_data is None:
+        changed_data = get_changed_data(object, action)
 
     change = init_change(
         object,
@@ -37,11 +44,7 @@ def _create_changes(object, action):
         action,
         ContentType.objects.get_for_model(object._meta.model),
     )
-
-    if MERGE_CHANGES and _local.merge_changes_allowed:
-        _local.put_change_to_stack(change)
-    else:
-        change.save()
+    save_changes([change], using)
 
 
 def update_model_attrs(signal, sender, instance, **kwargs):
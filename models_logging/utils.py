@@ -1,13 +1,19 @@
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import QuerySet, sql
 from django.db.models.fields.files import FieldFile
 
 from models_logging import _local, settings
-from models_logging.helpers import create_revision_with_changes, init_change
-from models_logging.models import Change
+from models_logging.helpers import (
+    acreate_revision_with_changes,
+    create_revision_with_changes,
+    init_change,
+)
+from models_logging.writers import save_changes
 
 try:
     from django.contrib.gis.geos import Point
@@ -57,34 +63,119 @@ def create_merged_changes():
     _local.stack_changes = {}
     _local.merge_changes_allowed = True
 
-    yield
+    try:
+        yield
+        create_revision_with_changes(_local.stack_changes.values())
+    finally:
+        _local.stack_changes = {}
+        _local.merge_changes_allowed = False
 
-    create_revision_with_changes(_local.stack_changes.values())
 
+@asynccontextmanager
+async def acreate_merged_changes():
+    """
+    async version of `create_merged_changes`
+    async def some_task():
+        async with acreate_merged_changes():
+            await obj.asave()
+    :return:
+    """
     _local.stack_changes = {}
-    _local.merge_changes_allowed = False
+    _local.merge_changes_allowed = True
 
+    try:
+        yield
+        await acreate_revision_with_changes(_local.stack_changes.values())
+    finally:
+        _local.stack_changes = {}
+        _local.merge_changes_allowed = False
+
+
+def create_changes_for_update(
+    queryset, chunk_size=None, progress_callback=None, **fields
+):
+    """
+    Updates the queryset with `fields` and logs the changes of every updated row
+    :param chunk_size: update the queryset by ranges of `chunk_size` rows ordered by pk,
+    every range is updated and its changes are written in a separate transaction,
+    so memory usage doesn't depend on the size of the queryset
+    :param progress_callback: called after every chunk with
+    the number of updated rows and the last processed pk
+    :return: number of updated rows
+    """
+    if not chunk_size:
+        with transaction.atomic(using=queryset.db):
+            rows, changes = _update_with_changes(queryset, fields)
+            save_changes(changes, queryset.db)
+        return rows
+
+    rows, last_pk = 0, None
+    for chunk, upper_pk in pk_ranges(queryset, chunk_size):
+        with transaction.atomic(using=queryset.db):
+            chunk_rows, changes = _update_with_changes(chunk, fields)
+            # not merged to `_local.stack_changes` to keep memory bounded
+            save_changes(changes, queryset.db, merge=False)
+
+        rows += chunk_rows
+        if upper_pk is not None:
+            last_pk = upper_pk
+        elif changes:
+            last_pk = changes[-1].object_id
+        if progress_callback:
+            progress_callback(rows, last_pk)
+    return rows
 
-def create_changes_for_update(queryset, **fields):
-    def _get_values(qs):
-        return {item["pk"]: item for item in qs.values("pk", *fields)}
 
-    old_values = _get_values(queryset)
-    rows = queryset.update(**fields)
-    new_values = _get_values(queryset.model.objects.filter(id__in=old_values.keys()))
+def pk_ranges(queryset, size, after_pk=None):
+    """
+    Splits the queryset to ranges of `size` rows ordered by pk,
+    the next range is looked up when the previous one is processed,
+    so it's safe to update or delete rows of the range
+    :param after_pk: start from rows with pk greater than it
+    :return: generator of (queryset of the range, pk of the last row in the range),
+    the pk is None for the last range
+    """
+    queryset = queryset.order_by("pk")
+    while True:
+        chunk = queryset if after_pk is None else queryset.filter(pk__gt=after_pk)
+        # pk of the last row in the range, None if there are less rows left
+        upper_pk = next(iter(chunk.values_list("pk", flat=True)[size - 1 : size]), None)
+        if upper_pk is None:
+            yield chunk, None
+            return
+        yield chunk.filter(pk__lte=upper_pk), upper_pk
+        after_pk = upper_pk
+
+
+def _update_with_changes(queryset, fields):
+    """
+    :return: number of updated rows and not saved changes
+    """
+    connection = connections[queryset.db]
+    if queryset.model._meta.parents:
+        # fields of parent models are updated by separate queries of their tables
+        values = _update_select_for_update(queryset, fields)
+    elif connection.vendor == "postgresql":
+        values = _update_returning_postgresql(queryset, fields, connection)
+    elif (
+        connection.vendor == "sqlite"
+        and connection.features.can_return_columns_from_insert
+    ):
+        values = _update_returning_sqlite(queryset, fields, connection)
+    else:
+        values = _update_select_for_update(queryset, fields)
 
     content_type = ContentType.objects.get_for_model(queryset.model)
 
     changes = []
-    for pk, item in old_values.items():
+    for pk, (old_values, new_values) in sorted(values.items()):
         changed_data = {
-            field: {"old": old_value, "new": new_values[pk][field]}
-            for field, old_value in item.items()
-            if field != "pk"
+            field: {"old": old_value, "new": new_values[field]}
+            for field, old_value in old_values.items()
         }
         changes.append(
             init_change(
-                item,
+                {"pk": pk, **old_values},
                 changed_data,
                 settings.CHANGED,
                 content_type,
@@ -92,10 +183,141 @@ def create_changes_for_update(queryset, **fields):
             )
         )
 
-    if settings.MERGE_CHANGES and _local.merge_changes_allowed:
-        for change in changes:
-            _local.put_change_to_stack(change)
-    else:
-        Change.objects.bulk_create(changes)
+    return len(values), changes
 
-    return rows
+
+def _update_returning_postgresql(queryset, fields, connection):
+    """
+    One statement, rows are locked and their old values are read in the CTE,
+    then updated and returned with new values:
+    WITH "old" ("pk", "c0") AS (SELECT ... FOR UPDATE)
+    UPDATE "table" SET ... FROM "old" WHERE "table"."id" = "old"."pk"
+    RETURNING "table"."id", "old"."c0", "table"."field"
+    """
+    model = queryset.model
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    names = list(fields)
+    columns = [qn(model._meta.get_field(name).column) for name in names]
+    aliases = ["c%s" % i for i in range(len(names))]
+
+    select_sql, select_params = (
+        queryset.order_by()
+        .select_for_update(of=("self",))
+        .values_list("pk", *names)
+        .query.get_compiler(connection=connection)
+        .as_sql()
+    )
+    update_query = sql.UpdateQuery(model)
+    update_query.add_update_values(fields)
+    update_sql, update_params = update_query.get_compiler(
+        connection=connection
+    ).as_sql()
+
+    pk_column = "%s.%s" % (table, qn(model._meta.pk.column))
+    returning = [pk_column]
+    returning += ['"old".%s' % alias for alias in aliases]
+    returning += ["%s.%s" % (table, column) for column in columns]
+    query = (
+        'WITH "old" ("pk", %s) AS (%s) %s FROM "old" WHERE %s = "old"."pk" RETURNING %s'
+        % (
+            ", ".join(aliases),
+            select_sql,
+            update_sql,
+            pk_column,
+            ", ".join(returning),
+        )
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(query, (*select_params, *update_params))
+        rows = cursor.fetchall()
+
+    convert = _get_converters(model, names, connection)
+    values = {}
+    for row in rows:
+        pk = convert[0](row[0])
+        old = row[1 : len(names) + 1]
+        new = row[len(names) + 1 :]
+        values[pk] = (
+            {n: convert[i + 1](v) for i, (n, v) in enumerate(zip(names, old))},
+            {n: convert[i + 1](v) for i, (n, v) in enumerate(zip(names, new))},
+        )
+    return values
+
+
+def _update_returning_sqlite(queryset, fields, connection):
+    """
+    SQLite can't return values of the joined rows, so old values are read first,
+    the transaction keeps other connections from writing these rows
+    until the UPDATE ... RETURNING of new values
+    """
+    model = queryset.model
+    qn = connection.ops.quote_name
+    names = list(fields)
+    old_values = {
+        row[0]: dict(zip(names, row[1:]))
+        for row in queryset.order_by().values_list("pk", *names)
+    }
+
+    update_query = queryset.query.chain(sql.UpdateQuery)
+    update_query.add_update_values(fields)
+    update_query.clear_ordering(force=True)
+    update_query.clear_select_clause()
+    update_sql, update_params = update_query.get_compiler(
+        connection=connection
+    ).as_sql()
+    returning = [model._meta.pk.column]
+    returning += [model._meta.get_field(name).column for name in names]
+    query = "%s RETURNING %s" % (update_sql, ", ".join(map(qn, returning)))
+    with connection.cursor() as cursor:
+        cursor.execute(query, update_params)
+        rows = cursor.fetchall()
+
+    convert = _get_converters(model, names, connection)
+    values = {}
+    for row in rows:
+        pk = convert[0](row[0])
+        if pk in old_values:
+            new = {n: convert[i + 1](v) for i, (n, v) in enumerate(zip(names, row[1:]))}
+            values[pk] = (old_values[pk], new)
+    return values
+
+
+def _update_select_for_update(queryset, fields):
+    """
+    Portable version, rows are locked while reading old values,
+    so they can't be changed before the UPDATE
+    """
+
+    def _get_values(qs):
+        return {item.pop("pk"): item for item in qs.values("pk", *fields)}
+
+    old_values = _get_values(queryset.select_for_update())
+    # not `queryset.update`, it's logged again by `LoggingQuerySet`
+    QuerySet.update(queryset, **fields)
+    new_values = _get_values(
+        queryset.model._base_manager.using(queryset.db).filter(pk__in=old_values.keys())
+    )
+    return {pk: (old_values[pk], new_values[pk]) for pk in old_values}
+
+
+def _get_converters(model, names, connection):
+    """
+    Functions converting raw values of the pk and `names` fields
+    returned by the cursor as the compiler does for querysets
+    """
+
+    def _converter(field):
+        col = field.get_col(model._meta.db_table)
+        converters = connection.ops.get_db_converters(col)
+        converters += col.get_db_converters(connection)
+
+        def convert(value):
+            for converter in converters:
+                value = converter(value, col, connection)
+            return value
+
+        return convert
+
+    fields = [model._meta.pk] + [model._meta.get_field(name) for name in names]
+    return [_converter(field) for field in fields]
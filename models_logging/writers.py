@@ -0,0 +1,242 @@
+import atexit
+import logging
+import threading
+import time
+from typing import List
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, router, transaction
+
+from models_logging import settings, _local
+from models_logging.models import Change, ChangeField
+
+logger = logging.getLogger(__name__)
+
+BLOCK = "block"
+DROP = "drop"
+SYNC = "sync"
+
+
+def save_changes(changes: List[Change], using=None, merge=True):
+    """
+    Stores changes created by signals and `create_changes_for_update`:
+    merges them to `_local.stack_changes`, defers them to the commit of the transaction,
+    puts them to the write-behind buffer or writes them immediately
+    :param using: alias of the database where the logged objects are written
+    :param merge: False to skip merging to `_local.stack_changes`
+    """
+    merge = merge and settings.MERGE_CHANGES and _local.merge_changes_allowed
+    if transaction.get_connection(using).in_atomic_block and (
+        # merged changes of rolled back savepoints are dropped,
+        # changes written to another database are not rolled back with the transaction,
+        # the buffer accepts changes of committed transactions only
+        merge
+        or settings.DEFER_TO_COMMIT
+        or settings.WRITE_BEHIND
+        or not is_logging_database(using)
+    ):
+        defer_to_commit(changes, using, merge)
+    elif merge:
+        for change in changes:
+            _local.put_change_to_stack(change)
+    else:
+        write_changes(changes, using)
+
+
+def is_logging_database(using=None):
+    return router.db_for_write(Change) == (using or DEFAULT_DB_ALIAS)
+
+
+def write_changes(changes: List[Change], using=None):
+    if settings.WRITE_BEHIND:
+        change_buffer.put(changes, using)
+    else:
+        insert_changes(changes)
+
+
+def insert_changes(changes: List[Change]):
+    if len(changes) == 1:
+        changes[0].save()
+    elif changes:
+        Change.objects.bulk_create(changes)
+    insert_change_fields(changes)
+
+
+def insert_change_fields(changes: List[Change]):
+    """
+    Writes names of changed fields of saved changes with `LOGGING_FIELD_INDEX`,
+    pks of changes must be returned by `bulk_create` (not supported by MySQL)
+    """
+    if settings.FIELD_INDEX:
+        ChangeField.objects.bulk_create(ChangeField.for_changes(changes))
+
+
+async def ainsert_change_fields(changes: List[Change]):
+    if settings.FIELD_INDEX:
+        await ChangeField.objects.abulk_create(ChangeField.for_changes(changes))
+
+
+class DeferredChanges:
+    """
+    on_commit callback writing changes collected in one savepoint of a transaction.
+    Django discards callbacks of rolled back savepoints, so their changes are never written.
+    :param merge: put changes to `_local.stack_changes` if they are still merged on commit
+    """
+
+    def __init__(self, using, merge=False):
+        self.using = using
+        self.merge = merge
+        self.changes = []
+
+    def __call__(self):
+        if self.merge and _local.merge_changes_allowed:
+            for change in self.changes:
+                _local.put_change_to_stack(change)
+        else:
+            write_changes(self.changes, self.using)
+
+
+def defer_to_commit(changes: List[Change], using=None, merge=False):
+    connection = transaction.get_connection(using)
+    savepoint_ids = set(connection.savepoint_ids)
+    # callbacks are registered with ids of active savepoints,
+    # look for the callback of the current savepoint
+    for sids, func, robust in reversed(connection.run_on_commit):
+        if (
+            isinstance(func, DeferredChanges)
+            and func.merge == merge
+            and sids == savepoint_ids
+        ):
+            func.changes.extend(changes)
+            return
+
+    callback = DeferredChanges(using, merge)
+    callback.changes.extend(changes)
+    transaction.on_commit(callback, using=using)
+
+
+class ChangeBuffer:
+    """
+    Bounded in-process buffer of changes of committed transactions,
+    they are written with `bulk_create` when `batch_size` changes are collected,
+    every `flush_interval` seconds and on exit of the process.
+    :param max_size: max number of buffered changes (including changes being written)
+    :param overflow: what to do with new changes when the buffer is full:
+    "block" - wait until the buffer is written,
+    "drop" - drop new changes,
+    "sync" - write new changes immediately
+    """
+
+    def __init__(self, batch_size, max_size, flush_interval, overflow):
+        if overflow not in (BLOCK, DROP, SYNC):
+            raise ImproperlyConfigured(
+                "LOGGING_WRITE_BEHIND_OVERFLOW must be one of %s, %s, %s"
+                % (BLOCK, DROP, SYNC)
+            )
+        self.batch_size = batch_size
+        self.max_size = max(max_size, batch_size)
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+
+        self.condition = threading.Condition()
+        self.changes = []
+        self.in_flight = 0
+        self.last_flush = time.monotonic()
+        self.thread = None
+
+    def __len__(self):
+        return len(self.changes) + self.in_flight
+
+    def put(self, changes: List[Change], using=None):
+        if transaction.get_connection(using).in_atomic_block:
+            # changes of a transaction are buffered when it's committed
+            defer_to_commit(changes, using)
+            return
+
+        with self.condition:
+            if self.overflow == BLOCK:
+                while self.in_flight and len(self) + len(changes) > self.max_size:
+                    self.condition.wait()
+            full = len(self) + len(changes) > self.max_size
+            if not full:
+                self.changes.extend(changes)
+
+        if full:
+            if self.overflow == DROP:
+                logger.warning("Buffer of changes is full, %s dropped", len(changes))
+                return
+            elif self.overflow == SYNC:
+                insert_changes(changes)
+                return
+            # nothing is being written by other threads, write the buffer here
+            self.flush_outside_transaction()
+            with self.condition:
+                self.changes.extend(changes)
+
+        self.start_thread()
+        if len(self.changes) >= self.batch_size or (
+            self.flush_interval
+            and time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush_outside_transaction()
+
+    def flush_outside_transaction(self):
+        """
+        Writes the buffer unless the database of changes is in a transaction
+        of this thread: the buffer has changes of other threads and transactions,
+        they would be lost with its rollback. Then it's written on commit
+        or by the flushing thread.
+        """
+        using = router.db_for_write(Change)
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            self.flush()
+        elif not any(func == self.flush for _, func, _ in connection.run_on_commit):
+            transaction.on_commit(self.flush, using=using)
+
+    def flush(self):
+        with self.condition:
+            changes, self.changes = self.changes, []
+            self.in_flight += len(changes)
+            self.last_flush = time.monotonic()
+
+        try:
+            if changes:
+                Change.objects.bulk_create(changes, batch_size=self.batch_size)
+                insert_change_fields(changes)
+        except Exception:
+            # the logged objects are saved already, don't break the caller
+            logger.exception("Failed to write %s changes", len(changes))
+        finally:
+            with self.condition:
+                self.in_flight -= len(changes)
+                self.condition.notify_all()
+
+    def start_thread(self):
+        if self.flush_interval and self.thread is None:
+            with self.condition:
+                if self.thread is None:
+                    self.thread = threading.Thread(
+                        target=self.flush_periodically,
+                        name="models-logging-flush",
+                        daemon=True,
+                    )
+                    self.thread.start()
+
+    def flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+                close_old_connections()
+
+
+change_buffer = ChangeBuffer(
+    settings.WRITE_BEHIND_BATCH_SIZE,
+    settings.WRITE_BEHIND_MAX_SIZE,
+    settings.WRITE_BEHIND_FLUSH_INTERVAL,
+    settings.WRITE_BEHIND_OVERFLOW,
+)
+
+if settings.WRITE_BEHIND:
+    atexit.register(change_buffer.flush)
@@ -0,0 +1,168 @@
+import gc
+import time
+import tracemalloc
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+from django.db.models.signals import post_init, post_save, pre_save
+
+from models_logging.helpers import LazyLoggingAttrs
+from models_logging.settings import LAZY_SNAPSHOTS
+from models_logging.signals import (
+    init_model_attrs,
+    init_model_attrs_lazy,
+    save_model,
+    update_model_attrs,
+)
+
+
+_benchmark_models = {}
+
+
+def create_benchmark_model(fields_count, name="LoggingBenchmark"):
+    """
+    Throwaway model with `fields_count` integer fields, a text and a json field.
+    Every measurement uses its own class (on the same table),
+    so CPython's shared instance dicts of one mode don't affect another.
+    Classes are reused by later runs in the process, models can't be registered twice.
+    """
+    class_name = "%s%s" % (name, fields_count)
+    if class_name in _benchmark_models:
+        return _benchmark_models[class_name]
+
+    meta = type(
+        "Meta",
+        (),
+        {"app_label": "testapp", "db_table": "testapp_benchmark_%s" % fields_count},
+    )
+    attrs = {
+        "__module__": __name__,
+        "Meta": meta,
+        "name": models.CharField(max_length=100),
+        "data": models.JSONField(default=dict),
+    }
+    for i in range(fields_count):
+        attrs["field_%s" % i] = models.IntegerField(default=i)
+    model = _benchmark_models[class_name] = type(class_name, (models.Model,), attrs)
+    return model
+
+
+class Command(BaseCommand):
+    help = "Measure the overhead of models_logging when loading and saving instances"
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=["iterate", "save"])
+        parser.add_argument("--rows", type=int, default=50000)
+        parser.add_argument(
+            "--fields",
+            type=int,
+            nargs="+",
+            default=[10],
+            help="numbers of model fields, every number is measured separately",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        for fields in options["fields"]:
+            self.stdout.write("%s fields:" % fields)
+            model = create_benchmark_model(fields)
+            with connection.schema_editor() as editor:
+                editor.create_model(model)
+            try:
+                model.objects.bulk_create(
+                    (
+                        model(name="row %s" % i, data={"i": i})
+                        for i in range(options["rows"])
+                    ),
+                    batch_size=500,
+                )
+                benchmark = getattr(self, "benchmark_%s" % options["scenario"])
+                benchmark(**{**options, "fields": fields})
+            finally:
+                with connection.schema_editor() as editor:
+                    editor.delete_model(model)
+
+    def benchmark_iterate(self, fields, repeat, **options):
+        receivers = {
+            "without logging": None,
+            "eager snapshots": init_model_attrs,
+            "lazy snapshots": init_model_attrs_lazy,
+        }
+        baseline = None
+        for title, receiver in receivers.items():
+            model = create_benchmark_model(fields, title.title().replace(" ", ""))
+            if receiver:
+                model._logging_attrs = LazyLoggingAttrs()
+                post_init.connect(receiver, sender=model)
+
+            def load():
+                return list(model.objects.all())
+
+            seconds = self.measure(load, repeat)
+            memory = self.measure_memory(load)
+            baseline = baseline or seconds
+            self.stdout.write(
+                "  %-16s %8.3fs  %+7.1f%%  memory %8.1f MB"
+                % (title, seconds, (seconds / baseline - 1) * 100, memory / 2**20)
+            )
+
+    def benchmark_save(self, fields, rows, repeat, **options):
+        init_receiver = init_model_attrs_lazy if LAZY_SNAPSHOTS else init_model_attrs
+        receivers = {
+            "without logging": [],
+            "with logging": [
+                (post_init, init_receiver),
+                (pre_save, update_model_attrs),
+                (post_save, save_model),
+            ],
+        }
+        baseline = None
+        for title, signals in receivers.items():
+            model = create_benchmark_model(fields, title.title().replace(" ", ""))
+            model._logging_attrs = LazyLoggingAttrs()
+            for signal, receiver in signals:
+                signal.connect(receiver, sender=model)
+
+            def save(objects):
+                for obj in objects:
+                    obj.name += "!"
+                    obj.save()
+
+            seconds = self.measure(
+                save, repeat, setup=lambda: list(model.objects.all())
+            )
+            baseline = baseline or seconds
+            self.stdout.write(
+                "  %-16s %8.3fs  %+7.1f%%  %6.1f µs per save"
+                % (title, seconds, (seconds / baseline - 1) * 100, seconds / rows * 1e6)
+            )
+
+            # changes are deleted by cascade
+            ContentType.objects.get_for_model(model).delete()
+            ContentType.objects.clear_cache()
+
+    @staticmethod
+    def measure(func, repeat, setup=None):
+        """
+        :param setup: called before every run, its result is passed to `func`
+        :return: best time of `repeat` runs
+        """
+        best = None
+        for _ in range(repeat):
+            args = (setup(),) if setup else ()
+            start = time.perf_counter()
+            func(*args)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    @staticmethod
+    def measure_memory(func):
+        """:return: memory held by the result of `func`"""
+        gc.collect()
+        tracemalloc.start()
+        result = func()  # noqa: F841
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return memory
@@ -0,0 +1,28 @@
+from django.db import models
+
+from models_logging.managers import LoggingManager
+
+
+class Author(models.Model):
+    name = models.CharField(max_length=100)
+
+    def __str__(self):
+        return self.name
+
+
+class Book(models.Model):
+    author = models.ForeignKey(
+        Author, on_delete=models.CASCADE, null=True, blank=True, related_name="books"
+    )
+    title = models.CharField(max_length=100)
+    price = models.IntegerField(default=0)
+    tags = models.JSONField(default=list, blank=True)
+
+    objects = LoggingManager()
+
+    def __str__(self):
+        return self.title
+
+
+class Ebook(Book):
+    fmt = models.CharField(max_length=10, default="epub")
@@ -53,6 +53,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "models_logging.middleware.LoggingStackMiddleware",
 ]
 
 ROOT_URLCONF = "testapp.urls"
@@ -127,6 +128,8 @@ STATIC_URL = "/static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
+LOGGING_MODELS = ("testapp",)
+
 try:
     from .settings_local import *  # noqa
 except ImportError:
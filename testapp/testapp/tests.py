@@ -0,0 +1,269 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+
+from models_logging.models import Change, ChangeField, Revision
+from models_logging.partitions import (
+    convert_to_partitioned,
+    create_partitions,
+    get_partitions,
+    is_partitioned,
+)
+from models_logging.revert import revert_changes
+from models_logging.utils import create_changes_for_update, create_merged_changes
+
+from .models import Author, Book, Ebook
+
+
+class UpdateWithChangesTest(TestCase):
+    def setUp(self):
+        self.ebook = Ebook.objects.create(title="e", price=1, fmt="epub")
+        self.book = Book.objects.create(title="b", price=1)
+
+    def get_changed_data(self, model, obj):
+        return Change.objects.get(
+            content_type=ContentType.objects.get_for_model(model),
+            object_id=obj.pk,
+            action="changed",
+        ).changed_data
+
+    def test_parent_field_of_child_model(self):
+        rows = create_changes_for_update(
+            Ebook.objects.filter(pk=self.ebook.pk), price=2
+        )
+
+        self.assertEqual(rows, 1)
+        self.assertEqual(Book.objects.get(pk=self.ebook.pk).price, 2)
+        self.assertEqual(
+            self.get_changed_data(Ebook, self.ebook), {"price": {"old": 1, "new": 2}}
+        )
+
+    def test_parent_and_child_fields(self):
+        Ebook.objects.filter(pk=self.ebook.pk).update(price=3, fmt="pdf")
+
+        ebook = Ebook.objects.get(pk=self.ebook.pk)
+        self.assertEqual((ebook.price, ebook.fmt), (3, "pdf"))
+        self.assertEqual(
+            self.get_changed_data(Ebook, self.ebook),
+            {"price": {"old": 1, "new": 3}, "fmt": {"old": "epub", "new": "pdf"}},
+        )
+
+    def test_model_without_parents(self):
+        Book.objects.filter(pk=self.book.pk).update(price=5)
+
+        self.assertEqual(
+            self.get_changed_data(Book, self.book), {"price": {"old": 1, "new": 5}}
+        )
+
+
+class MergedChangesTest(TransactionTestCase):
+    def get_logged_titles(self):
+        return sorted(Change.objects.values_list("object_repr", flat=True))
+
+    def test_rolled_back_changes_are_not_merged(self):
+        with create_merged_changes():
+            Book.objects.create(title="committed")
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    Book.objects.create(title="rolled back")
+                    raise ValueError
+
+        self.assertEqual(self.get_logged_titles(), ["committed"])
+        self.assertEqual(Revision.objects.count(), 1)
+
+    def test_rolled_back_savepoint(self):
+        with create_merged_changes():
+            with transaction.atomic():
+                Book.objects.create(title="outer")
+                with self.assertRaises(ValueError):
+                    with transaction.atomic():
+                        Book.objects.create(title="inner")
+                        raise ValueError
+
+        self.assertEqual(self.get_logged_titles(), ["outer"])
+
+    def test_changes_are_merged_on_commit(self):
+        with create_merged_changes():
+            with transaction.atomic():
+                book = Book.objects.create(title="a", price=1)
+                book.price = 2
+                book.save()
+
+        change = Change.objects.get()
+        self.assertEqual(change.changed_data["price"], {"old": None, "new": 2})
+        self.assertIsNotNone(change.revision_id)
+
+
+class LoggingStackMiddlewareTest(TransactionTestCase):
+    def setUp(self):
+        self.client.raise_request_exception = False
+
+    def test_rolled_back_request(self):
+        response = self.client.get("/authors/atomic-create/?name=a&fail=1")
+
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Author.objects.exists())
+        self.assertFalse(Change.objects.exists())
+        self.assertFalse(Revision.objects.exists())
+
+    def test_committed_request(self):
+        self.client.get("/authors/atomic-create/?name=a")
+
+        change = Change.objects.get()
+        self.assertEqual(change.action, "added")
+        self.assertIsNotNone(change.revision_id)
+
+    def test_failed_request_without_transaction(self):
+        # the author is committed before the error, so it's logged
+        response = self.client.get("/authors/create/?name=a&fail=1")
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(Author.objects.count(), 1)
+        self.assertIsNotNone(Change.objects.get().revision_id)
+
+    def test_merging_is_disabled_after_request(self):
+        self.client.get("/authors/create/?name=a")
+        Author.objects.create(name="b")
+
+        self.assertEqual(Change.objects.count(), 2)
+        self.assertIsNone(Change.objects.get(object_repr="b").revision_id)
+
+
+class RevertChangesTest(TestCase):
+    def get_changes(self, pk, action):
+        return Change.objects.filter(
+            content_type=ContentType.objects.get_for_model(Book),
+            object_id=pk,
+            action=action,
+        )
+
+    def test_deleted_object_is_recreated(self):
+        book = Book.objects.create(title="a", price=3)
+        pk = book.pk
+        book.delete()
+
+        revert_changes(self.get_changes(pk, "deleted"))
+        restored = Book.objects.get(pk=pk)
+        self.assertEqual((restored.title, restored.price), ("a", 3))
+
+    def test_change_of_deleted_object_is_skipped(self):
+        book = Book.objects.create(title="a", price=3)
+        book.price = 4
+        book.save()
+        changed = list(self.get_changes(book.pk, "changed"))
+        book.delete()
+
+        revert_changes(changed)
+        self.assertFalse(Book.objects.exists())
+
+    def test_added_object_is_deleted(self):
+        book = Book.objects.create(title="a")
+
+        revert_changes(self.get_changes(book.pk, "added"))
+        self.assertFalse(Book.objects.exists())
+
+
+class BulkUpdateTest(TestCase):
+    def get_changed_data(self, book):
+        return Change.objects.get(
+            content_type=ContentType.objects.get_for_model(Book),
+            object_id=book.pk,
+            action="changed",
+        ).changed_data
+
+    def test_objects_of_bulk_create(self):
+        (book,) = Book.objects.bulk_create([Book(title="a", price=1)])
+        book.price = 7
+        Book.objects.bulk_update([book], ["price"])
+
+        self.assertEqual(self.get_changed_data(book), {"price": {"old": 1, "new": 7}})
+
+    def test_objects_created_by_save(self):
+        book = Book.objects.create(title="a", price=1)
+        book.price = 7
+        Book.objects.bulk_update([book], ["price"])
+
+        self.assertEqual(self.get_changed_data(book), {"price": {"old": 1, "new": 7}})
+
+    def test_loaded_objects(self):
+        Book.objects.create(title="a", price=1)
+        book = Book.objects.get()
+        book.price = 7
+        # old values are not read again
+        with self.assertNumQueries(2):
+            Book.objects.bulk_update([book], ["price"])
+
+        self.assertEqual(self.get_changed_data(book), {"price": {"old": 1, "new": 7}})
+
+
+class BatchCommandsTest(TestCase):
+    def setUp(self):
+        Book.objects.bulk_create([Book(title=str(i)) for i in range(3)])
+
+    def test_backfill_changes(self):
+        Change.objects.update(object_pk_int=None)
+        ChangeField.objects.all().delete()
+
+        out = StringIO()
+        call_command(
+            "backfill_changes",
+            "--object-pk-int",
+            "--field-index",
+            "--batch-size=2",
+            stdout=out,
+        )
+        self.assertFalse(Change.objects.filter(object_pk_int__isnull=True).exists())
+        self.assertTrue(ChangeField.objects.exists())
+        self.assertIn("object_pk_int: 3 updated", out.getvalue())
+
+    def test_delete_changes(self):
+        out = StringIO()
+        call_command("delete_changes", "--batch-size=2", stdout=out)
+        self.assertFalse(Change.objects.exists())
+        self.assertIn("Changes: 2 deleted", out.getvalue())
+
+
+class PartitionsTest(TestCase):
+    def test_months_are_validated(self):
+        for months in (-1, "3; DROP TABLE x", 1.5, True):
+            with self.subTest(months=months):
+                with self.assertRaises(ValueError):
+                    create_partitions(connection, months)
+                with self.assertRaises(ValueError):
+                    convert_to_partitioned(connection, months)
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning requires PostgreSQL")
+class ConvertToPartitionedTest(TransactionTestCase):
+    def test_convert_populated_table(self):
+        Book.objects.bulk_create([Book(title=str(i)) for i in range(10)])
+        last_pk = Change.objects.latest("pk").pk
+
+        convert_to_partitioned(connection, months=2)
+
+        self.assertTrue(is_partitioned(connection))
+        self.assertEqual(Change.objects.count(), 10)
+        partitions = get_partitions(connection)
+        # the old table, the default one, the month after it and 2 months ahead
+        self.assertEqual(len(partitions), 5)
+        self.assertEqual(sum(p.default for p in partitions), 1)
+
+        # the sequence continues after the converted rows
+        Book.objects.create(title="new")
+        self.assertGreater(Change.objects.latest("pk").pk, last_pk)
+        self.assertEqual(Change.objects.count(), 11)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT i.relname, x.indisvalid FROM pg_index x "
+                "JOIN pg_class i ON i.oid = x.indexrelid "
+                "WHERE x.indrelid = to_regclass(%s)",
+                [Change._meta.db_table],
+            )
+            indexes = dict(cursor.fetchall())
+        for index in Change._meta.indexes:
+            self.assertIs(indexes.get(index.name), True)
@@ -17,6 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from . import views
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("authors/create/", views.create_author),
+    path("authors/atomic-create/", views.atomic_create_author),
 ]
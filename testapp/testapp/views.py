@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.http import HttpResponse
+
+from .models import Author
+
+
+def create_author(request):
+    Author.objects.create(name=request.GET["name"])
+    if "fail" in request.GET:
+        raise ValueError("Author is rolled back")
+    return HttpResponse()
+
+
+# the same as with ATOMIC_REQUESTS
+atomic_create_author = transaction.atomic(create_author)